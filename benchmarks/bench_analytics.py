@@ -0,0 +1,124 @@
+"""Benchmark the session analytics at 1M detail rows.
+
+    python benchmarks/bench_analytics.py [--rows 1000000] [--with-db]
+
+Times ``compute_analytics`` on synthetic arrays and, with ``--with-db``, the
+end-to-end path including ``load_session_arrays`` against a temporary SQLite
+database created with the application's schema and removed afterwards.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from src.main import create_app
+from src.models.schema import create_schema
+from src.models.stock_opname import db
+from src.services.analytics import compute_analytics, load_session_arrays
+
+
+def synthetic_arrays(rows, seed=42):
+    rng = np.random.default_rng(seed)
+    product_ids = np.arange(1, rows + 1, dtype=np.int64)
+    saldo_awal = rng.poisson(40, rows).astype(np.int64)
+    jumlah_barang = np.maximum(saldo_awal + rng.normal(0, 3, rows).round().astype(np.int64), 0)
+    # A sprinkling of estimated counts and gross miscounts
+    estimated = rng.random(rows) < 0.02
+    jumlah_barang[estimated] = (jumlah_barang[estimated] // 10) * 10
+    miscounted = rng.random(rows) < 0.001
+    jumlah_barang[miscounted] = 0
+    return product_ids, saldo_awal, jumlah_barang
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def _chunks(rows, size=50_000):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def fill_database(arrays):
+    product_ids, saldo_awal, jumlah_barang = arrays
+    tables = db.metadata.tables
+    db.session.execute(tables['stock_opname_sessions'].insert(), [{'id': 1, 'lokasi': 'BENCH', 'status': 'completed'}])
+    for chunk in _chunks(
+        {'id': int(i), 'kode_produk': f'BRG{i:08d}', 'nama_produk': f'Barang {i}', 'saldo_awal': int(s)}
+        for i, s in zip(product_ids, saldo_awal)
+    ):
+        db.session.execute(tables['products'].insert(), chunk)
+    for chunk in _chunks(
+        {'session_id': 1, 'product_id': int(i), 'jumlah_barang': int(j)}
+        for i, j in zip(product_ids, jumlah_barang)
+    ):
+        db.session.execute(tables['stock_opname_details'].insert(), chunk)
+    db.session.commit()
+
+
+def bench_with_db(arrays, repeat):
+    with tempfile.TemporaryDirectory(prefix='bench_analytics_') as directory:
+        # The real schema, indexes included, so the plans match production
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'app.db'),
+            'TESTING': True,
+            'METRICS_ENABLED': False,
+            'CATALOG_SNAPSHOT_ENABLED': False,
+        })
+        with app.app_context():
+            create_schema()
+            started = time.perf_counter()
+            fill_database(arrays)
+            fill_seconds = time.perf_counter() - started
+            load_seconds, loaded = timed(lambda: load_session_arrays(1), repeat)
+            total_seconds, _ = timed(lambda: compute_analytics(*load_session_arrays(1)), repeat)
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+    return {
+        'fill_seconds': round(fill_seconds, 3),
+        'load_seconds': round(load_seconds, 4),
+        'end_to_end_seconds': round(total_seconds, 4),
+        'rows_loaded': int(loaded[0].size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--with-db', action='store_true', help='also time loading from SQLite')
+    args = parser.parse_args()
+
+    arrays = synthetic_arrays(args.rows)
+    compute_seconds, result = timed(lambda: compute_analytics(*arrays), args.repeat)
+    report = {
+        'rows': args.rows,
+        'compute_seconds': round(compute_seconds, 4),
+        'rows_per_second': round(args.rows / compute_seconds),
+        'outliers_total': result.get('outliers_total', 0),
+    }
+    if args.with_db:
+        report['db'] = bench_with_db(arrays, args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark worker startup time and per-worker memory.
+
+    python benchmarks/bench_startup.py [--workers 4] [--skip-gunicorn]
+
+Reports, each in a fresh interpreter, the time and peak RSS to import
+``src.main`` and to serve a first scan request, with pandas/openpyxl loaded
+lazily (current behaviour) and eagerly (as before). It then starts gunicorn with
+and without ``--preload`` and reads RSS/PSS for every worker from
+``/proc/<pid>/smaps_rollup`` (Linux only).
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_SCRIPT = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+if {eager}:
+    import pandas, openpyxl
+import src.main
+imported = time.perf_counter()
+client = src.main.app.test_client()
+client.post('/api/products', json={{'kode_produk': 'BENCH-1', 'nama_produk': 'Bench', 'saldo_awal': 1}})
+session = client.post('/api/sessions', json={{'lokasi': 'BENCH'}}).get_json()['data']['id']
+client.post(f'/api/sessions/{{session}}/details', json={{'product_id': 1, 'jumlah_barang': 1}})
+served = time.perf_counter()
+print(json.dumps({{
+    'import_seconds': round(imported - started, 4),
+    'first_scan_seconds': round(served - started, 4),
+    'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    'pandas_loaded': 'pandas' in sys.modules,
+}}))
+"""
+
+
+def fresh_database():
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_startup_'), 'app.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.main', 'init-db'],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+    return env
+
+
+def measure_startup(eager, repeat):
+    runs = []
+    for _ in range(repeat):
+        env = fresh_database()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT.format(eager=eager)],
+                                cwd=ROOT, env=env, check=True, capture_output=True, text=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda run: run['first_scan_seconds'])
+    return best
+
+
+def read_memory(pid):
+    memory = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                memory[key.lower() + '_mb'] = round(int(value.split()[0]) / 1024, 1)
+    return memory
+
+
+def child_pids(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def measure_gunicorn(preload, workers, port):
+    env = fresh_database()
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+               'src.main:app']
+    if preload:
+        command.insert(3, '--preload')
+    started = time.perf_counter()
+    master = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/api/products', timeout=1).read()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.05)
+        ready_seconds = time.perf_counter() - started
+        time.sleep(1)
+        worker_memory = [read_memory(pid) for pid in child_pids(master.pid)]
+        return {
+            'preload': preload,
+            'ready_seconds': round(ready_seconds, 3),
+            'master': read_memory(master.pid),
+            'workers': worker_memory,
+            'total_pss_mb': round(sum(w['pss_mb'] for w in worker_memory) + read_memory(master.pid)['pss_mb'], 1),
+        }
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    args = parser.parse_args()
+
+    report = {
+        'startup': {
+            'lazy': measure_startup(False, args.repeat),
+            'eager': measure_startup(True, args.repeat),
+        }
+    }
+    if not args.skip_gunicorn:
+        report['gunicorn'] = [
+            measure_gunicorn(False, args.workers, args.port),
+            measure_gunicorn(True, args.workers, args.port + 1),
+        ]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Synthetic warehouse datasets for the benchmarks.
+
+Catalogs mix the code formats seen in real stock files (internal ``BRG-``
+codes, EAN-13 barcodes with the Indonesian ``899`` prefix, supplier codes) and
+build names from brand / product / variant / size vocabularies. Book
+quantities are heavy-tailed, and counted quantities stay close to the book
+with occasional miscounts. Everything is seeded, so a given size always
+produces the same data.
+"""
+import os
+import random
+import sqlite3
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+BRANDS = [
+    'Indomie', 'Sedaap', 'Aqua', 'Le Minerale', 'Teh Pucuk', 'Sosro', 'Kapal Api', 'ABC', 'Indomilk',
+    'Ultra', 'Frisian Flag', 'Dancow', 'Chitato', 'Qtela', 'Taro', 'Roma', 'Khong Guan', 'Sari Roti',
+    'Lifebuoy', 'Pepsodent', 'Rinso', 'So Klin', 'Sunlight', 'Mama Lemon', 'Baygon', 'Wipol', 'Zwitsal',
+    'Bango', 'Sasa', 'Royco', 'Masako', 'Filma', 'Bimoli', 'Sania', 'Gulaku', 'Tropicana Slim',
+]
+PRODUCTS = [
+    'Mi Goreng', 'Mi Kuah', 'Air Mineral', 'Teh Melati', 'Kopi Bubuk', 'Susu Kental Manis', 'Susu UHT',
+    'Keripik Kentang', 'Biskuit Kelapa', 'Wafer', 'Roti Tawar', 'Sabun Mandi', 'Pasta Gigi', 'Deterjen Bubuk',
+    'Sabun Cuci Piring', 'Obat Nyamuk', 'Pembersih Lantai', 'Minyak Goreng', 'Kecap Manis', 'Penyedap Rasa',
+    'Kaldu Ayam', 'Gula Pasir', 'Sampo', 'Bedak Bayi', 'Tisu Wajah', 'Saus Sambal',
+]
+VARIANTS = [
+    'Original', 'Pedas', 'Ayam Bawang', 'Soto', 'Rendang', 'Jeruk Nipis', 'Lemon', 'Coklat', 'Vanila', 'Stroberi',
+    'Keju', 'Rumput Laut', 'Mint', 'Lavender', 'Sakura', 'Fresh', 'Extra', 'Lite', 'Gold', 'Premium',
+]
+SIZES_LABELS = ['50g', '75g', '85g', '100g', '150g', '200g', '250ml', '330ml', '600ml', '1L', '1.5L', '5L',
+                '400g', '800g', '1kg', '2kg']
+SUPPLIER_PREFIXES = ['ABM', 'SMR', 'IDF', 'UNV', 'WIN', 'MYR', 'GGF', 'OTS']
+
+
+def resolve_size(size):
+    if isinstance(size, int):
+        return size
+    return SIZES.get(size.lower()) or int(size)
+
+
+def _ean13(rng, used):
+    while True:
+        body = '899' + ''.join(rng.choice('0123456789') for _ in range(9))
+        digits = [int(d) for d in body]
+        check = (10 - (sum(digits[0::2]) + 3 * sum(digits[1::2])) % 10) % 10
+        code = body + str(check)
+        if code not in used:
+            return code
+
+
+def generate_catalog(size, seed=1):
+    """Return ``[(kode_produk, nama_produk, saldo_awal), ...]`` with unique codes."""
+    rng = random.Random(seed)
+    size = resolve_size(size)
+    used = set()
+    catalog = []
+    for i in range(1, size + 1):
+        roll = rng.random()
+        if roll < 0.6:
+            code = f'BRG-{i:07d}'
+        elif roll < 0.85:
+            code = _ean13(rng, used)
+        else:
+            code = f'{rng.choice(SUPPLIER_PREFIXES)}{i:07d}'
+        used.add(code)
+        # Popular brands and products show up far more often than the tail
+        name = ' '.join((
+            BRANDS[min(int(rng.paretovariate(1.2)) - 1, len(BRANDS) - 1)],
+            PRODUCTS[min(int(rng.paretovariate(1.1)) - 1, len(PRODUCTS) - 1)],
+            rng.choice(VARIANTS),
+            rng.choice(SIZES_LABELS),
+        ))
+        saldo_awal = int(rng.lognormvariate(3, 1.2)) if rng.random() > 0.05 else 0
+        catalog.append((code, name, saldo_awal))
+    return catalog
+
+
+def counted_quantity(rng, saldo_awal):
+    roll = rng.random()
+    if roll < 0.7:
+        return saldo_awal
+    if roll < 0.97:
+        return max(0, saldo_awal + rng.randint(-3, 3))
+    return rng.choice((0, saldo_awal * 10, (saldo_awal // 10 + 1) * 10))
+
+
+def build_database(path, size, sessions=12, lines_per_session=None, seed=1):
+    """Create a SQLite database with a catalog of ``size`` SKUs and counting sessions.
+
+    The schema comes from the application itself so the benchmark exercises the
+    same tables and indexes as production. Returns a summary dict.
+    """
+    from src.main import create_app
+    from src.models.schema import create_schema
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'METRICS_ENABLED': False})
+    with app.app_context():
+        create_schema()
+
+    size = resolve_size(size)
+    catalog = generate_catalog(size, seed)
+    lines_per_session = lines_per_session or max(1, size // sessions)
+    rng = random.Random(seed + 1)
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.executemany(
+        "INSERT INTO products (id, kode_produk, nama_produk, saldo_awal, created_at) "
+        "VALUES (?, ?, ?, ?, datetime('now'))",
+        ((i, code, name, saldo) for i, (code, name, saldo) in enumerate(catalog, start=1)),
+    )
+    for session_id in range(1, sessions + 1):
+        status = 'completed' if session_id < sessions else 'active'
+        conn.execute(
+            "INSERT INTO stock_opname_sessions (id, lokasi, waktu_mulai, waktu_selesai, status, created_by) "
+            "VALUES (?, ?, datetime('now'), CASE WHEN ? = 'completed' THEN datetime('now') END, ?, 'bench')",
+            (session_id, f'GUDANG-A/LORONG-{session_id:02d}', status, status),
+        )
+        product_ids = rng.sample(range(1, size + 1), min(lines_per_session, size))
+        conn.executemany(
+            "INSERT INTO stock_opname_details (session_id, product_id, jumlah_barang, catatan, created_at, updated_at) "
+            "VALUES (?, ?, ?, '', datetime('now'), datetime('now'))",
+            ((session_id, pid, counted_quantity(rng, catalog[pid - 1][2])) for pid in product_ids),
+        )
+    conn.commit()
+    conn.close()
+    return {'skus': size, 'sessions': sessions, 'lines_per_session': lines_per_session,
+            'active_session_id': sessions, 'completed_session_id': 1}
+
+
+def write_import_file(path, size, rows, seed=2):
+    """Write an import workbook with ``rows`` lines: 80% updates of existing SKUs, 20% new ones."""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    size = resolve_size(size)
+    catalog = generate_catalog(size)
+    updates = rng.sample(catalog, min(int(rows * 0.8), size))
+    new = [(f'NEW-{i:07d}', f'Produk Baru {i}', rng.randint(0, 500)) for i in range(rows - len(updates))]
+    data = [(code, name, saldo + rng.randint(-5, 5) if saldo > 5 else saldo) for code, name, saldo in updates] + new
+    frame = pd.DataFrame(data, columns=['Kode', 'Nama Barang', 'Jumlah'])
+    if path.endswith('.csv'):
+        frame.to_csv(path, index=False)
+    else:
+        frame.to_excel(path, index=False, engine='openpyxl')
+    return os.path.getsize(path)
@@ -0,0 +1,211 @@
+"""Load-test the scan path under each gunicorn serving profile.
+
+    python benchmarks/loadtest.py [--profiles sync,gthread,asgi] [--requests 5000] [--concurrency 16]
+                                  [--background-exports 4] [--group-commit off,on]
+
+For every profile a gunicorn server is started (using ``gunicorn.conf.py``) on
+a fresh SQLite database seeded with products and one active session. Client
+threads then send ``POST /api/sessions/<id>/details`` over keep-alive
+connections; requests/s and p50/p99 latency are printed as JSON. Profiles
+whose optional dependencies are missing are reported as skipped.
+
+With ``--background-exports N``, N more threads keep requesting
+``/api/export/products/excel`` while the scans are measured, to check that
+bulk traffic does not push scan p99 up; how many exports were served and how
+many were turned away with 503 is reported alongside.
+
+``--group-commit off,on`` runs every profile once per setting of
+``GROUP_COMMIT_ENABLED``, to compare scans/s and p99 with and without
+batching the scan commits.
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROFILE_DEPENDENCIES = {
+    'sync': [],
+    'gthread': [],
+    'asgi': ['a2wsgi', 'uvicorn'],
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def seed_database(products):
+    path = os.path.join(tempfile.mkdtemp(prefix='loadtest_'), 'app.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'src.main', 'init-db'],
+                   cwd=ROOT, env=env, check=True, capture_output=True)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO products (kode_produk, nama_produk, saldo_awal) VALUES (?, ?, ?)',
+        ((f'BRG{i:07d}', f'Barang {i}', random.randint(0, 200)) for i in range(1, products + 1)),
+    )
+    conn.execute("INSERT INTO stock_opname_sessions (lokasi, status, created_by) VALUES ('LOADTEST', 'active', 'loadtest')")
+    conn.commit()
+    conn.close()
+    return env
+
+
+def wait_until_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/sessions')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def run_clients(port, total, concurrency, products):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    per_client = total // concurrency
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        failed = 0
+        for _ in range(per_client):
+            body = json.dumps({'product_id': random.randint(1, products), 'jumlah_barang': random.randint(0, 50)})
+            started = time.perf_counter()
+            try:
+                conn.request('POST', '/api/sessions/1/details', body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def start_exports(port, count, stop):
+    counts = {'exports_ok': 0, 'exports_rejected': 0, 'exports_failed': 0}
+    lock = threading.Lock()
+
+    def exporter():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while not stop.is_set():
+            try:
+                conn.request('GET', '/api/export/products/excel')
+                response = conn.getresponse()
+                response.read()
+                key = {200: 'exports_ok', 503: 'exports_rejected'}.get(response.status, 'exports_failed')
+                if response.status == 503:
+                    stop.wait(float(response.getheader('Retry-After', 1)))
+            except (OSError, http.client.HTTPException):
+                key = 'exports_failed'
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=exporter, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, counts
+
+
+def run_profile(profile, port, args, group_commit='off'):
+    missing = [name for name in PROFILE_DEPENDENCIES[profile] if importlib.util.find_spec(name) is None]
+    if missing:
+        return {'profile': profile, 'skipped': f"missing optional packages: {', '.join(missing)}"}
+
+    env = seed_database(args.products)
+    env.update(GUNICORN_PROFILE=profile, PORT=str(port),
+               GROUP_COMMIT_ENABLED='1' if group_commit == 'on' else '0')
+    if args.workers:
+        env['WEB_CONCURRENCY'] = str(args.workers)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port)
+        run_clients(port, min(args.requests, 200), args.concurrency, args.products)  # warm-up
+        stop = threading.Event()
+        exporters, export_counts = start_exports(port, args.background_exports, stop)
+        try:
+            result = run_clients(port, args.requests, args.concurrency, args.products)
+        finally:
+            stop.set()
+            for thread in exporters:
+                thread.join()
+        if exporters:
+            result.update(export_counts)
+        return {'profile': profile, 'group_commit': group_commit, **result}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', default='sync,gthread,asgi')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=None, help='override WEB_CONCURRENCY')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--group-commit', default='off', help='off, on, or off,on to compare')
+    parser.add_argument('--background-exports', type=int, default=0,
+                        help='threads requesting Excel exports while scans are measured')
+    args = parser.parse_args()
+
+    runs = [
+        (profile, group_commit)
+        for profile in args.profiles.split(',')
+        for group_commit in args.group_commit.split(',')
+    ]
+    results = [
+        run_profile(profile, args.port + offset, args, group_commit)
+        for offset, (profile, group_commit) in enumerate(runs)
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Check that the session list filters are answered from indexes.
+
+    python benchmarks/query_plans.py [--sessions 20000] [--verbose]
+
+Fills a temporary database with synthetic sessions, requests
+``GET /api/sessions`` with every supported filter through the Flask test
+client and runs ``EXPLAIN QUERY PLAN`` on each SELECT the route issues. Exits
+non-zero if any plan reads a session or detail table with a full table scan.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from src.main import create_app
+from src.models.schema import create_schema
+from src.models.stock_opname import db
+
+TABLES = ('stock_opname_sessions', 'stock_opname_details', 'session_archives')
+WAREHOUSES = ['JKT', 'SBY', 'BDG', 'MDN', 'SMG']
+USERS = ['admin', 'gudang1', 'gudang2', 'auditor']
+
+FILTERS = [
+    {},
+    {'status': 'active'},
+    {'status': 'completed', 'page': 3},
+    {'lokasi': 'JKT/Rak 01'},
+    {'lokasi_prefix': 'SBY/'},
+    {'created_by': 'auditor'},
+    {'from': '2024-03-01', 'to': '2024-04-01'},
+    {'status': 'completed', 'from': '2024-03-01'},
+    {'lokasi_prefix': 'JKT', 'status': 'active'},
+    {'created_by': 'gudang1', 'to': '2024-02-01'},
+]
+
+
+def fill_database(sessions, seed=42):
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1)
+    rows = []
+    for session_id in range(1, sessions + 1):
+        waktu_mulai = started + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        completed = rng.random() < 0.9
+        rows.append({
+            'id': session_id,
+            'lokasi': f'{rng.choice(WAREHOUSES)}/Rak {rng.randrange(1, 60):02d}',
+            'waktu_mulai': waktu_mulai,
+            'waktu_selesai': waktu_mulai + timedelta(hours=2) if completed else None,
+            'status': 'completed' if completed else 'active',
+            'created_by': rng.choice(USERS),
+        })
+    db.session.execute(db.metadata.tables['stock_opname_sessions'].insert(), rows)
+    db.session.commit()
+
+
+def explain_selects(engine, plans):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            plan = cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+            plans.append((statement, [row[3] for row in plan]))
+
+
+def full_scans(plan):
+    return [
+        line for line in plan
+        if line.startswith('SCAN ') and 'USING' not in line and line.split()[1] in TABLES
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=20_000)
+    parser.add_argument('--verbose', action='store_true', help='Print every plan, not only the failing ones.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(directory, 'plans.db'),
+            'TESTING': True,
+            'METRICS_ENABLED': False,
+            'CATALOG_SNAPSHOT_ENABLED': False,
+        })
+        with app.app_context():
+            create_schema()
+            fill_database(args.sessions)
+            plans = []
+            explain_selects(db.engine, plans)
+
+        client = app.test_client()
+        failures = 0
+        for filters in FILTERS:
+            del plans[:]
+            response = client.get('/api/sessions', query_string=filters)
+            body = response.get_json()
+            if response.status_code != 200:
+                print(f'{filters}: HTTP {response.status_code} {body}')
+                failures += 1
+                continue
+            scans = [(statement, plan) for statement, plan in plans if full_scans(plan)]
+            failures += bool(scans)
+            print(f"{'FULL SCAN' if scans else 'ok':9} {filters} -> {body['pagination']['total']} sessions")
+            for statement, plan in (plans if args.verbose else scans):
+                print('    ' + ' '.join(statement.split())[:160])
+                for line in plan:
+                    print('        ' + line)
+        return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
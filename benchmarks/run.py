@@ -0,0 +1,205 @@
+"""Run the hot-path benchmarks against a synthetic warehouse.
+
+    python -m benchmarks.run --size 10k [--scenarios scan,search] [--out results.json]
+    python -m benchmarks.run --compare before.json after.json
+
+Each scenario drives the Flask test client and reports throughput, p50/p99
+latency and peak Python memory (tracemalloc, measured on a separate pass so
+it does not distort the timings). Results are JSON, tagged with the current
+git commit, so two runs can be compared.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.datasets import build_database, resolve_size, write_import_file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SEARCH_TERMS = ['indomie', 'goreng', 'BRG-00012', '899', 'susu', 'pedas 85g', 'sabun', 'kopi']
+
+
+def scenarios_for(context):
+    client = context['client']
+    rng = random.Random(7)
+    active = context['dataset']['active_session_id']
+    completed = context['dataset']['completed_session_id']
+    skus = context['dataset']['skus']
+
+    def check(response):
+        if response.status_code >= 400:
+            raise RuntimeError(f'{response.request.path} returned {response.status_code}: {response.data[:200]!r}')
+        response.close()
+        return response
+
+    def scan():
+        check(client.post(f'/api/sessions/{active}/details', json={
+            'product_id': rng.randint(1, skus), 'jumlah_barang': rng.randint(0, 100)}))
+
+    def search():
+        check(client.get('/api/products/search', query_string={'q': rng.choice(SEARCH_TERMS), 'limit': 10}))
+
+    def details():
+        check(client.get(f'/api/sessions/{completed}/details')).data
+
+    def import_xlsx():
+        with open(context['import_file'], 'rb') as f:
+            check(client.post('/api/import/products', data={'file': (io.BytesIO(f.read()), 'catalog.xlsx')},
+                              content_type='multipart/form-data'))
+
+    def import_csv():
+        with open(context['import_csv_file'], 'rb') as f:
+            check(client.post('/api/import/products/csv', data=f.read(), content_type='text/csv'))
+
+    def export_csv():
+        check(client.get(f'/api/sessions/{completed}/export')).data
+
+    def export_xlsx():
+        check(client.get(f'/api/export/stock-opname/{completed}/excel')).data
+
+    def export_products_csv():
+        check(client.get('/api/export/products')).data
+
+    return {
+        'scan': (scan, 500),
+        'search': (search, 200),
+        'details': (details, 5),
+        'import_xlsx': (import_xlsx, 1),
+        'import_csv': (import_csv, 1),
+        'export_csv': (export_csv, 5),
+        'export_xlsx': (export_xlsx, 3),
+        'export_products_csv': (export_products_csv, 3),
+    }
+
+
+def percentile(sorted_values, p):
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn, iterations, memory=True):
+    fn()  # warm-up: first-call imports, caches, statement compilation
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    result = {
+        'iterations': iterations,
+        'ops_per_second': round(iterations / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+    if memory:
+        tracemalloc.start()
+        fn()
+        result['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    from src.main import create_app
+
+    size = resolve_size(args.size)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_')
+    db_path = os.path.join(workdir, f'bench_{size}.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    started = time.perf_counter()
+    dataset = build_database(db_path, size, sessions=args.sessions)
+    dataset['build_seconds'] = round(time.perf_counter() - started, 2)
+
+    import_rows = min(size, args.import_rows)
+    import_file = os.path.join(workdir, f'import_{import_rows}.xlsx')
+    write_import_file(import_file, size, import_rows)
+    import_csv_file = os.path.join(workdir, f'import_{import_rows}.csv')
+    write_import_file(import_csv_file, size, import_rows)
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}', 'METRICS_ENABLED': False})
+    selected = args.scenarios.split(',') if args.scenarios else None
+    results = {}
+    with app.app_context():
+        context = {'client': app.test_client(), 'dataset': dataset, 'import_file': import_file,
+                   'import_csv_file': import_csv_file}
+        for name, (fn, iterations) in scenarios_for(context).items():
+            if selected and name not in selected:
+                continue
+            iterations = max(1, int(iterations * args.scale))
+            print(f'{name} x{iterations} ...', file=sys.stderr)
+            results[name] = measure(fn, iterations, memory=not args.no_memory)
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'size': size,
+        'dataset': dict(dataset, import_rows=import_rows),
+        'results': results,
+    }
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    rows = {}
+    for name, new in after['results'].items():
+        old = before['results'].get(name)
+        if not old:
+            continue
+        rows[name] = {
+            key: {'before': old[key], 'after': new[key], 'ratio': round(new[key] / old[key], 3) if old[key] else None}
+            for key in ('ops_per_second', 'p50_ms', 'p99_ms', 'peak_memory_mb') if key in old and key in new
+        }
+    return {'before': before.get('commit'), 'after': after.get('commit'), 'scenarios': rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='10k', help='10k, 100k, 1m or a number of SKUs')
+    parser.add_argument('--sessions', type=int, default=12)
+    parser.add_argument('--scenarios', help='comma separated subset of: scan, search, details, import_xlsx, '
+                                            'import_csv, export_csv, export_xlsx, export_products_csv')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every iteration count')
+    parser.add_argument('--import-rows', type=int, default=50_000, help='rows in the import workbook (capped at size)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--workdir', help='where to build the database (default: a temp dir)')
+    parser.add_argument('--out', help='write the JSON report here as well as to stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two reports')
+    args = parser.parse_args()
+
+    report = compare(*args.compare) if args.compare else run(args)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""gunicorn configuration, picked up automatically from the working directory.
+
+    gunicorn                          # gthread profile, src.main:app
+    GUNICORN_PROFILE=sync gunicorn
+    GUNICORN_PROFILE=asgi gunicorn    # needs a2wsgi + uvicorn
+
+Every setting can still be overridden on the command line.
+"""
+import gc
+import multiprocessing
+import os
+
+profile = os.environ.get('GUNICORN_PROFILE', 'gthread')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+if profile == 'sync':
+    worker_class = 'sync'
+    wsgi_app = 'src.main:app'
+elif profile == 'gthread':
+    # Scan requests are short and mostly wait on SQLite; threads let one
+    # worker keep serving them while another thread runs an export.
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+    wsgi_app = 'src.main:app'
+elif profile == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'src.asgi:app'
+else:
+    raise RuntimeError(f'Unknown GUNICORN_PROFILE: {profile}')
+
+# Build the app once in the master and fork workers from it (copy-on-write)
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Move everything the master has loaded into the permanent generation so
+    # the workers' garbage collector never writes to (and un-shares) it.
+    # Collection stays off until the fork is done, in both processes.
+    gc.disable()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    # Pooled connections must not be shared with the master
+    from src.main import dispose_engines
+    dispose_engines()
+
+
+# The master's side of the fork; gunicorn has no hook for it
+os.register_at_fork(after_in_parent=gc.enable)
+
+# Tablets reuse connections between scans
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Exports of large sessions can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+
+# Recycle workers periodically; the jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG')
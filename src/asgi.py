@@ -0,0 +1,16 @@
+"""ASGI entry point: ``gunicorn -k uvicorn.workers.UvicornWorker src.asgi:app``.
+
+The Flask app runs on a thread pool behind an event loop, so slow responses
+(long exports, streamed aggregates) hold a pool thread rather than a whole
+worker process. Requires the optional ``a2wsgi`` and ``uvicorn`` packages.
+"""
+import os
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError as e:
+    raise RuntimeError('The ASGI adapter needs the optional packages: pip install a2wsgi uvicorn') from e
+
+from src.main import create_app
+
+app = WSGIMiddleware(create_app(), workers=int(os.environ.get('ASGI_THREADS', 16)))
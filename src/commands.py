@@ -0,0 +1,131 @@
+import click
+from flask import current_app, g
+
+from src.models.schema import create_schema
+from src.services.archive import archive_sessions
+from src.services.catalog_snapshot import build_snapshot
+from src.services.data_version import publish_data_version
+from src.services.purge import delete_sessions, sessions_between
+from src.services.backup import create_backup, list_backups, prune_backups, restore_backup, sqlite_path
+from src.services.replica import refresh_replica
+from src.services.sharding import fan_out, resync_session_directory, shard_engine, shards
+from src.services.static_assets import precompress
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    def init_db():
+        """Create missing tables and indexes."""
+        try:
+            create_schema()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo('Database schema is up to date.')
+
+    @app.cli.command('precompress-static')
+    @click.option('--min-size', default=1024, show_default=True, help='Skip files smaller than this many bytes.')
+    def precompress_static(min_size):
+        """Write .gz/.br variants of the static assets for the server to send as-is."""
+        written = precompress(current_app.static_folder, min_size=min_size)
+        click.echo(f'{written} precompressed files written.')
+
+    @app.cli.command('archive-sessions')
+    @click.option('--older-than-days', type=int, help='Defaults to ARCHIVE_AFTER_DAYS.')
+    @click.option('--dry-run', is_flag=True, help='List the sessions without moving anything.')
+    @click.option('--vacuum', is_flag=True, help='Run VACUUM afterwards to return the freed pages to the OS.')
+    def archive_sessions_command(older_than_days, dry_run, vacuum):
+        """Move the details of old completed sessions into per-month archive files."""
+        if older_than_days is None:
+            older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+        total = 0
+        for shard in shards():
+            with current_app.app_context():
+                g.shard = shard
+                archived = archive_sessions(current_app.config['ARCHIVE_DIR'], older_than_days, dry_run=dry_run)
+                for session, file, row_count in archived:
+                    rows = 'would be archived' if dry_run else f'{row_count} rows'
+                    click.echo(f'Session {session.id} ({session.lokasi}) -> {file}: {rows}')
+            total += len(archived)
+            if vacuum and archived and not dry_run:
+                with shard_engine(shard).connect() as connection:
+                    connection.exec_driver_sql('VACUUM')
+                click.echo(f'Database {shard or "main"} vacuumed.')
+        click.echo(f'{total} sessions {"to archive" if dry_run else "archived"}.')
+
+    @app.cli.command('purge-sessions')
+    @click.option('--from', 'start', type=click.DateTime(), help='Sessions started on or after this date.')
+    @click.option('--to', 'end', type=click.DateTime(), help='Sessions started before this date.')
+    @click.option('--status', type=click.Choice(['completed', 'active', 'all']), default='completed', show_default=True)
+    @click.option('--dry-run', is_flag=True, help='List the sessions without deleting anything.')
+    def purge_sessions_command(start, end, status, dry_run):
+        """Delete sessions started in a date range, with their details."""
+        if start is None and end is None:
+            raise click.UsageError('--from or --to is required')
+        session_ids = sorted(
+            session_id
+            for _, ids in fan_out(sessions_between, start, end, None if status == 'all' else status)
+            for session_id in ids
+        )
+        if dry_run:
+            click.echo(f"{len(session_ids)} sessions to delete: {', '.join(map(str, session_ids))}")
+            return
+        deleted = [result for _, result in fan_out(
+            delete_sessions, session_ids, current_app.config['ARCHIVE_DIR'], current_app.config['DELETE_CHUNK_ROWS']
+        )]
+        sessions_deleted = sum(sessions for sessions, _ in deleted)
+        details_deleted = sum(details for _, details in deleted)
+        # Workers' cached reports must not show the purged sessions
+        publish_data_version()
+        click.echo(f'{sessions_deleted} sessions and {details_deleted} details deleted.')
+
+    @app.cli.command('refresh-replica')
+    def refresh_replica_command():
+        """Copy the primary SQLite database over the read replica."""
+        size = refresh_replica(current_app)
+        click.echo(f'Replica refreshed ({size} bytes).')
+
+    @app.cli.command('build-catalog-snapshot')
+    def build_catalog_snapshot_command():
+        """Rebuild the mmap-ed product catalog snapshot used for code lookups."""
+        count = build_snapshot(current_app.config['CATALOG_SNAPSHOT_PATH'])
+        click.echo(f'Catalog snapshot written ({count} products).')
+
+    def database_file():
+        path = sqlite_path(current_app.config['SQLALCHEMY_DATABASE_URI'])
+        if path is None:
+            raise click.ClickException('Backups need the primary database to be a SQLite file.')
+        return path
+
+    @app.cli.command('backup-db')
+    @click.option('--keep', type=int, help='Prune to this many backups afterwards. Defaults to BACKUP_KEEP.')
+    def backup_db_command(keep):
+        """Take an online backup of the database into BACKUP_DIR."""
+        config = current_app.config
+        backup = create_backup(database_file(), config['BACKUP_DIR'], config['BACKUP_STEP_PAGES'], config['BACKUP_STEP_SLEEP'])
+        click.echo(f"Backup {backup['name']} written ({backup['size']} bytes, {backup['seconds']}s).")
+        for name in prune_backups(config['BACKUP_DIR'], config['BACKUP_KEEP'] if keep is None else keep):
+            click.echo(f'Pruned {name}.')
+
+    @app.cli.command('list-backups')
+    def list_backups_command():
+        """List the backups in BACKUP_DIR, newest first."""
+        backups = list_backups(current_app.config['BACKUP_DIR'])
+        for backup in backups:
+            click.echo(f"{backup['name']}  {backup['size']:>12} bytes  {backup['created_at']}")
+        click.echo(f'{len(backups)} backups.')
+
+    @app.cli.command('restore-backup')
+    @click.argument('name')
+    @click.confirmation_option(prompt='Replace the live database with this backup?')
+    def restore_backup_command(name):
+        """Replace the database with a backup (the current state is backed up first)."""
+        config = current_app.config
+        safety = restore_backup(config['BACKUP_DIR'], name, database_file(), config['BACKUP_STEP_PAGES'], config['BACKUP_STEP_SLEEP'])
+        # Shards are not part of the backup; keep their newer sessions' ids taken
+        resynced = resync_session_directory()
+        if resynced:
+            click.echo(f'{resynced} sessions kept in shards re-registered.')
+        publish_data_version()
+        if config['CATALOG_SNAPSHOT_ENABLED']:
+            build_snapshot(config['CATALOG_SNAPSHOT_PATH'])
+        click.echo(f"Restored {name}; the previous state is in {safety['name']}.")
@@ -0,0 +1,109 @@
+import os
+
+DEFAULT_DATABASE_URI = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
+
+    # Database configuration
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Worker processes used to parse the sheets of a product import
+    IMPORT_MAX_WORKERS = int(os.environ.get('IMPORT_MAX_WORKERS', os.cpu_count() or 1))
+    IMPORT_PARALLEL_MIN_BYTES = int(os.environ.get('IMPORT_PARALLEL_MIN_BYTES', 1 << 20))
+    # Rows validated and written per step of a CSV import
+    IMPORT_CSV_CHUNK_ROWS = int(os.environ.get('IMPORT_CSV_CHUNK_ROWS', 100_000))
+    # Dry-run previews, kept on disk so any worker can serve the follow-up apply
+    IMPORT_PREVIEW_DIR = os.environ.get('IMPORT_PREVIEW_DIR', os.path.join(os.path.dirname(__file__), 'database', 'import_previews'))
+    IMPORT_PREVIEW_TTL = int(os.environ.get('IMPORT_PREVIEW_TTL', 3600))
+    # Worker processes rendering the XLSX files of a multi-session ZIP export
+    EXPORT_MAX_WORKERS = int(os.environ.get('EXPORT_MAX_WORKERS', os.cpu_count() or 1))
+
+    # Resumable uploads for large import files
+    UPLOAD_DIR = os.environ.get('UPLOAD_DIR', os.path.join(os.path.dirname(__file__), 'database', 'uploads'))
+    UPLOAD_TTL = int(os.environ.get('UPLOAD_TTL', 24 * 3600))
+    UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 1 << 30))
+
+    # mmap-ed product catalog shared by the workers, rebuilt after every import
+    CATALOG_SNAPSHOT_ENABLED = os.environ.get('CATALOG_SNAPSHOT_ENABLED', '1') == '1'
+    CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', os.path.join(os.path.dirname(__file__), 'database', 'catalog.snapshot'))
+
+    # Completed sessions older than this move to per-month archive files
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(os.path.dirname(__file__), 'database', 'archive'))
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+    # Detail rows removed per transaction when sessions are deleted
+    DELETE_CHUNK_ROWS = int(os.environ.get('DELETE_CHUNK_ROWS', 10_000))
+
+    # Online backups of the SQLite database (see src/services/backup.py);
+    # BACKUP_INTERVAL_SECONDS > 0 has one worker take them on a schedule
+    # (or run "flask backup-db" from cron instead)
+    BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(__file__), 'database', 'backups'))
+    BACKUP_INTERVAL_SECONDS = float(os.environ.get('BACKUP_INTERVAL_SECONDS', 0))
+    BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 14))
+    BACKUP_STEP_PAGES = int(os.environ.get('BACKUP_STEP_PAGES', 256))
+    BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', 0.005))
+
+    # Optional read replica for reports and exports (see src/services/replica.py)
+    REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 30))
+    REPLICA_REFRESH_SECONDS = float(os.environ.get('REPLICA_REFRESH_SECONDS', 0))
+
+    # Batch scan writes from concurrent requests into one commit (see
+    # src/services/group_commit.py); a scan is acknowledged once its batch commits
+    GROUP_COMMIT_ENABLED = os.environ.get('GROUP_COMMIT_ENABLED', '0') == '1'
+    GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get('GROUP_COMMIT_MAX_DELAY_MS', 5))
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH', 256))
+    GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT', 10))
+
+    # Per-warehouse shards, "NAME=url NAME=url" (see src/services/sharding.py);
+    # a session's warehouse is its lokasi up to the separator
+    SHARD_DATABASE_URLS = os.environ.get('SHARD_DATABASE_URLS', '')
+    SHARD_KEY_SEPARATOR = os.environ.get('SHARD_KEY_SEPARATOR', '/')
+
+    # Bulk routes (imports, exports, reports) per worker: running + queued must
+    # stay below the gthread thread count so scans always find a free thread
+    BULK_LIMIT_ENABLED = os.environ.get('BULK_LIMIT_ENABLED', '1') == '1'
+    BULK_MAX_CONCURRENCY = int(os.environ.get('BULK_MAX_CONCURRENCY', 1))
+    BULK_MAX_QUEUE = int(os.environ.get('BULK_MAX_QUEUE', 1))
+    BULK_QUEUE_TIMEOUT = float(os.environ.get('BULK_QUEUE_TIMEOUT', 30))
+    BULK_RETRY_AFTER = int(os.environ.get('BULK_RETRY_AFTER', 5))
+
+    # Request instrumentation (/metrics) and slow-query log
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
+    # Per-worker metric files merged by /metrics, so every gunicorn worker
+    # answers with the same monotonic totals; empty keeps them per process
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(os.path.dirname(__file__), 'database', 'metrics'))
+    METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 1))
+
+    # Opt-in per-request profiling: send the header to profile one request
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    PROFILING_HEADER = 'X-Profile'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(os.path.dirname(__file__), 'database', 'profiles'))
+    PROFILING_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS', 5))
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    # Drop connections the database closed while a worker was idle
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+
+
+configs = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
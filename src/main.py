@@ -3,49 +3,123 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+import weakref
+
+from flask import Flask
 from flask_cors import CORS
+from src.config import configs
 from src.models.user import db
 from src.models.stock_opname import Product, StockOpnameSession, StockOpnameDetail
+from src.commands import register_commands
+from src.services.metrics import init_metrics
+from src.services.profiling import init_profiling
+from src.services.replica import configure_replica, init_replica
+from src.services.scheduling import init_scheduling
+from src.services.group_commit import init_group_commit
+from src.services.backup import init_backups
+from src.services.sharding import configure_sharding, init_sharding
+from src.services.static_assets import StaticAssets
 from src.routes.user import user_bp
 from src.routes.stock_opname import stock_opname_bp
 from src.routes.import_export import import_export_bp
+from src.routes.report import report_bp
+from src.routes.backups import backups_bp
+from src.routes.uploads import uploads_bp
+from src.routes.debug import debug_bp
+
+_apps = weakref.WeakSet()
+
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+def dispose_engines():
+    """Drop the pooled connections inherited from the parent process.
 
-# Enable CORS for all routes
-CORS(app)
+    Called by gunicorn's ``post_fork`` hook (see ``gunicorn.conf.py``): a
+    worker forked from the preloaded master must not share its sockets.
+    """
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
 
-# Register blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(stock_opname_bp, url_prefix='/api')
-app.register_blueprint(import_export_bp, url_prefix='/api')
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+def create_app(config=None):
+    """Build the Flask application.
 
-with app.app_context():
-    db.create_all()
+    ``config`` is a name from ``src.config.configs``, a config class or a
+    mapping of overrides; it defaults to the ``APP_CONFIG`` environment
+    variable (``production`` when unset).
 
-@app.route('/', defaults={'path': ''}) 
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-            return "Static folder not configured", 404
+    Creating the app never touches the database, so it is safe to build it
+    once in a gunicorn ``--preload`` master and fork workers from it. Create
+    the schema with ``flask --app src.main init-db``.
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
+    if config is None or isinstance(config, str):
+        config = configs[config or os.environ.get('APP_CONFIG', 'production')]
+    if isinstance(config, type):
+        app.config.from_object(config)
     else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
+        app.config.from_object(configs['production'])
+        app.config.update(config)
+
+    # Enable CORS for all routes
+    CORS(app)
+
+    # Register blueprints
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(stock_opname_bp, url_prefix='/api')
+    app.register_blueprint(import_export_bp, url_prefix='/api')
+    app.register_blueprint(report_bp, url_prefix='/api')
+    app.register_blueprint(uploads_bp, url_prefix='/api')
+    app.register_blueprint(backups_bp, url_prefix='/api')
+
+    if app.config['REPLICA_DATABASE_URL']:
+        configure_replica(app)
+
+    configure_sharding(app)
+
+    db.init_app(app)
+    register_commands(app)
+
+    if app.config['REPLICA_DATABASE_URL']:
+        init_replica(app)
+    init_backups(app)
+    init_sharding(app)
+
+    if app.config['METRICS_ENABLED']:
+        init_metrics(app)
+    init_scheduling(app)
+    if app.config['GROUP_COMMIT_ENABLED']:
+        init_group_commit(app)
+
+    if app.config['PROFILING_ENABLED']:
+        init_profiling(app)
+        app.register_blueprint(debug_bp, url_prefix='/api')
+
+    static_assets = StaticAssets(app.static_folder, rescan=app.debug)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        static_folder_path = app.static_folder
+        if static_folder_path is None:
+                return "Static folder not configured", 404
+
+        # Unknown paths fall back to index.html so client-side routes work
+        asset = static_assets.find(path) if path != "" else None
+        if asset is None:
+            asset = static_assets.find('index.html')
+        if asset is None:
             return "index.html not found", 404
+        return static_assets.send(asset)
+
+    _apps.add(app)
+    return app
+
+
+app = create_app()
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True)
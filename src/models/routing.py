@@ -0,0 +1,24 @@
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = 'replica'
+SHARD_BIND_PREFIX = 'shard:'
+
+
+class RoutingSession(Session):
+    """Sends the reads of ``@read_replica`` views to the ``replica`` bind.
+
+    Everything else, and anything flushed from a replica view, goes to the
+    primary. Without a ``replica`` bind configured this is the stock session.
+    A request routed to a warehouse shard (``g.shard``, see
+    ``src/services/sharding.py``) reads and writes only that shard.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('shard'):
+            return self._db.engines[SHARD_BIND_PREFIX + g.shard]
+        if bind is None and not self._flushing and has_app_context() and g.get('read_replica'):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
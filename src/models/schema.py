@@ -0,0 +1,65 @@
+import logging
+
+from sqlalchemy import delete, func, inspect, select
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.models.routing import SHARD_BIND_PREFIX
+from src.models.stock_opname import SHARDED_TABLES, StockOpnameDetail
+
+logger = logging.getLogger(__name__)
+
+DETAILS_UNIQUE_INDEX = 'ix_stock_opname_details_session_product'
+
+
+def merge_duplicate_details(engine):
+    """Keep only the latest row of each ``(session_id, product_id)`` in the details.
+
+    The old ``add_session_detail`` could insert a product twice into a
+    session when two scans raced; a later scan always overwrote the count,
+    so the row written last is the one kept. Returns the rows removed.
+    """
+    details = StockOpnameDetail.__table__
+    latest = select(func.max(details.c.id)).group_by(details.c.session_id, details.c.product_id)
+    with engine.begin() as connection:
+        return connection.execute(delete(details).where(details.c.id.not_in(latest))).rowcount
+
+
+def _create_indexes(engine, tables):
+    existing = inspect(engine)
+    if (StockOpnameDetail.__table__ in tables
+            and existing.has_table(StockOpnameDetail.__tablename__)
+            and DETAILS_UNIQUE_INDEX not in {index['name'] for index in existing.get_indexes(StockOpnameDetail.__tablename__)}):
+        removed = merge_duplicate_details(engine)
+        if removed:
+            logger.warning('Removed %d duplicate session details before creating %s', removed, DETAILS_UNIQUE_INDEX)
+
+    for table in tables:
+        for index in table.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except IntegrityError as e:
+                raise RuntimeError(
+                    f'Cannot create unique index {index.name}: {table.name} has duplicate '
+                    f'({", ".join(column.name for column in index.columns)}) rows. '
+                    'Remove the duplicates (keep one row per key), then run init-db again.'
+                ) from e
+
+
+def create_schema():
+    """Create missing tables, then any indexes added to existing tables.
+
+    ``db.create_all()`` only emits indexes together with a new table, so
+    databases created before an index was declared would never receive it.
+    Duplicate details left by the old scan endpoint are merged before the
+    unique index on them is created.
+    """
+    # Only the primary: a read replica is a copy of it, not a separate schema
+    db.create_all(bind_key=None)
+    _create_indexes(db.engine, db.metadata.sorted_tables)
+
+    # Warehouse shards hold only the session tables
+    for key, engine in db.engines.items():
+        if key and key.startswith(SHARD_BIND_PREFIX):
+            db.metadata.create_all(engine, tables=SHARDED_TABLES)
+            _create_indexes(engine, SHARDED_TABLES)
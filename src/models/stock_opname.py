@@ -12,6 +12,7 @@ class Product(db.Model):
     
     # Relationship
     stock_details = db.relationship('StockOpnameDetail', backref='product', lazy=True)
+    barcodes = db.relationship('ProductBarcode', backref='product', lazy=True)
 
     def __repr__(self):
         return f'<Product {self.kode_produk}: {self.nama_produk}>'
@@ -25,8 +26,36 @@ class Product(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+# EAN/UPC barcodes printed on a product; one product may carry several
+class ProductBarcode(db.Model):
+    __tablename__ = 'product_barcodes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    barcode = db.Column(db.String(64), unique=True, nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ProductBarcode {self.barcode}: Product {self.product_id}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'barcode': self.barcode,
+            'product_id': self.product_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 class StockOpnameSession(db.Model):
     __tablename__ = 'stock_opname_sessions'
+    __table_args__ = (
+        # The session list, newest first, optionally filtered on one of
+        # these columns; lokasi prefix searches use the lokasi index too
+        db.Index('ix_stock_opname_sessions_waktu_mulai', 'waktu_mulai'),
+        db.Index('ix_stock_opname_sessions_status_waktu_mulai', 'status', 'waktu_mulai'),
+        db.Index('ix_stock_opname_sessions_lokasi_waktu_mulai', 'lokasi', 'waktu_mulai'),
+        db.Index('ix_stock_opname_sessions_created_by_waktu_mulai', 'created_by', 'waktu_mulai'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     lokasi = db.Column(db.String(200), nullable=False)
@@ -35,13 +64,22 @@ class StockOpnameSession(db.Model):
     status = db.Column(db.String(20), default='active')  # active, completed
     created_by = db.Column(db.String(100), default='system')
     
-    # Relationship
-    details = db.relationship('StockOpnameDetail', backref='session', lazy=True, cascade='all, delete-orphan')
+    # Relationship. Deleting a session leaves the child rows to the database
+    # (ON DELETE CASCADE) instead of loading them; see src/services/purge.py
+    details = db.relationship('StockOpnameDetail', backref='session', lazy=True,
+                              cascade='all, delete-orphan', passive_deletes=True)
+    archive = db.relationship('SessionArchive', uselist=False, lazy=True,
+                              cascade='all, delete-orphan', passive_deletes=True)
 
     def __repr__(self):
         return f'<StockOpnameSession {self.id}: {self.lokasi}>'
 
-    def to_dict(self):
+    def to_dict(self, item_count=None):
+        # item_count: (total_items, archived), when counted in bulk for a page
+        # of sessions (see session_item_counts in src/services/details.py)
+        if item_count is None:
+            item_count = (self.archive.row_count if self.archive else len(self.details) if self.details else 0,
+                          self.archive is not None)
         return {
             'id': self.id,
             'lokasi': self.lokasi,
@@ -49,14 +87,19 @@ class StockOpnameSession(db.Model):
             'waktu_selesai': self.waktu_selesai.isoformat() if self.waktu_selesai else None,
             'status': self.status,
             'created_by': self.created_by,
-            'total_items': len(self.details) if self.details else 0
+            'total_items': item_count[0],
+            'archived': item_count[1]
         }
 
 class StockOpnameDetail(db.Model):
     __tablename__ = 'stock_opname_details'
+    __table_args__ = (
+        # One row per product per session; also serves lookups and grouping by session
+        db.Index('ix_stock_opname_details_session_product', 'session_id', 'product_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('stock_opname_sessions.id'), nullable=False)
+    session_id = db.Column(db.Integer, db.ForeignKey('stock_opname_sessions.id', ondelete='CASCADE'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     jumlah_barang = db.Column(db.Integer, nullable=False)
     catatan = db.Column(db.Text, nullable=True)
@@ -76,4 +119,51 @@ class StockOpnameDetail(db.Model):
             'catatan': self.catatan,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        }
+
+# A completed session whose details were moved out of stock_opname_details into
+# an archive file (one SQLite file per month, relative to ARCHIVE_DIR); see
+# src/services/archive.py
+class SessionArchive(db.Model):
+    __tablename__ = 'session_archives'
+
+    session_id = db.Column(db.Integer, db.ForeignKey('stock_opname_sessions.id', ondelete='CASCADE'), primary_key=True)
+    file = db.Column(db.String(100), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SessionArchive {self.session_id}: {self.file}>'
+
+# Book quantities (saldo_awal) of the products in a session's scope, frozen
+# when the session was created so later product imports do not change its
+# variance; see src/services/session_book.py. Clustered on the primary key.
+class SessionBook(db.Model):
+    __tablename__ = 'session_book'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    session_id = db.Column(db.Integer, db.ForeignKey('stock_opname_sessions.id', ondelete='CASCADE'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True, autoincrement=False)
+    saldo_awal = db.Column(db.Integer, nullable=False)
+
+# Which shard each session created with sharding on lives in (None: this
+# database); also allocates session ids so they stay unique across shards.
+# Lives in the main database only; see src/services/sharding.py
+class SessionShard(db.Model):
+    __tablename__ = 'session_shards'
+
+    session_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.String(50), nullable=True)
+
+# Version of the data cached reports and exports are built from, replaced
+# by every change that alters them; see src/services/data_version.py
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.String(32), nullable=False)
+
+# Tables created in every warehouse shard
+SHARDED_TABLES = (
+    StockOpnameSession.__table__, StockOpnameDetail.__table__, SessionArchive.__table__, SessionBook.__table__
+)
@@ -0,0 +1,74 @@
+from flask import Blueprint, request, jsonify, current_app
+from src.models.user import db
+from src.services.catalog_snapshot import build_snapshot
+from src.services.data_version import publish_data_version
+from src.services.backup import create_backup, list_backups, prune_backups, restore_backup, sqlite_path
+from src.services.scheduling import bulk_route
+from src.services.sharding import resync_session_directory
+
+# Online backups of the SQLite database (see src/services/backup.py):
+#   GET  /api/backups                 list, newest first
+#   POST /api/backups                 take one now (then prune to BACKUP_KEEP)
+#   POST /api/backups/<name>/restore  {"confirm": "<name>"} replaces the live database
+backups_bp = Blueprint('backups', __name__)
+
+
+def database_file():
+    path = sqlite_path(current_app.config['SQLALCHEMY_DATABASE_URI'])
+    if path is None:
+        raise RuntimeError('Backups need the primary database to be a SQLite file')
+    return path
+
+
+@backups_bp.route('/backups', methods=['GET'])
+def get_backups():
+    try:
+        return jsonify({'success': True, 'data': list_backups(current_app.config['BACKUP_DIR'])})
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@backups_bp.route('/backups', methods=['POST'])
+@bulk_route
+def create_backup_now():
+    try:
+        config = current_app.config
+        backup = create_backup(database_file(), config['BACKUP_DIR'], config['BACKUP_STEP_PAGES'], config['BACKUP_STEP_SLEEP'])
+        pruned = prune_backups(config['BACKUP_DIR'], config['BACKUP_KEEP'])
+        return jsonify({'success': True, 'data': backup, 'pruned': pruned}), 201
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@backups_bp.route('/backups/<name>/restore', methods=['POST'])
+@bulk_route
+def restore_backup_now(name):
+    try:
+        data = request.get_json(silent=True) or {}
+        if data.get('confirm') != name:
+            return jsonify({'success': False, 'message': 'Send {"confirm": "<backup name>"} to restore'}), 400
+
+        config = current_app.config
+        # No connection of this worker may hold the database while it is replaced
+        db.session.close()
+        safety = restore_backup(config['BACKUP_DIR'], name, database_file(), config['BACKUP_STEP_PAGES'], config['BACKUP_STEP_SLEEP'])
+        # Shards are not part of the backup; keep their newer sessions' ids taken
+        resync_session_directory()
+        # Entries cached since the backup was taken carry the version it restores
+        publish_data_version()
+        if config['CATALOG_SNAPSHOT_ENABLED']:
+            build_snapshot(config['CATALOG_SNAPSHOT_PATH'])
+        return jsonify({
+            'success': True,
+            'message': f'Database restored from {name}',
+            'pre_restore_backup': safety
+        })
+
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'message': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
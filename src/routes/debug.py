@@ -0,0 +1,37 @@
+from flask import Blueprint, current_app, jsonify, send_from_directory
+from datetime import datetime
+import os
+
+# Only registered when PROFILING_ENABLED is set
+debug_bp = Blueprint('debug', __name__)
+
+
+@debug_bp.route('/_debug/profiles', methods=['GET'])
+def list_profiles():
+    try:
+        directory = current_app.config['PROFILING_DIR']
+        profiles = {}
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                name, ext = os.path.splitext(entry.name)
+                if ext not in ('.prof', '.collapsed'):
+                    continue
+                stat = entry.stat()
+                profile = profiles.setdefault(name, {
+                    'id': name,
+                    'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                    'files': {},
+                })
+                profile['files'][ext[1:]] = {'name': entry.name, 'size': stat.st_size}
+
+        return jsonify({
+            'success': True,
+            'data': sorted(profiles.values(), key=lambda p: p['created_at'], reverse=True)
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@debug_bp.route('/_debug/profiles/<path:filename>', methods=['GET'])
+def download_profile(filename):
+    return send_from_directory(current_app.config['PROFILING_DIR'], filename, as_attachment=True)
@@ -1,82 +1,413 @@
-from flask import Blueprint, request, jsonify, send_file, make_response
+from flask import Blueprint, Response, request, jsonify, send_file, make_response, current_app, stream_with_context
+from werkzeug.utils import secure_filename
 from src.models.stock_opname import db, Product, StockOpnameSession, StockOpnameDetail
-from openpyxl import Workbook
+from src.routes.uploads import upload_store, upload_error
+from src.services.uploads import UploadError
+from src.services.details import session_detail_rows
+from src.services.product_import import apply_products
+from src.services.catalog_snapshot import build_snapshot
+from src.services.data_version import bump_data_version, data_version
+from src.services.replica import read_replica
+from src.services.session_export import (
+    session_export_data, load_session_export, render_session, stream_sessions_zip
+)
+from src.services.sharding import fan_out, run_on_shard
+from src.services.scheduling import bulk_route
 import csv
 import io
-import pandas as pd
 from datetime import datetime
 import os
+import tempfile
+import time
 
+# pandas (and openpyxl, which pandas loads for Excel files) are imported inside
+# the handlers, so a worker only pays for them once an import or export runs.
 import_export_bp = Blueprint('import_export', __name__)
 
+def _is_dry_run():
+    return request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+
+def _preview_store():
+    from src.services.import_preview import PreviewStore
+
+    return PreviewStore(current_app.config['IMPORT_PREVIEW_DIR'], current_app.config['IMPORT_PREVIEW_TTL'])
+
+
+def _import_preview(products, errors, duplicate_count, **extra):
+    # Dry run: nothing is written, the parsed rows are kept for the apply
+    from src.services.import_preview import diff_products, diff_page
+
+    diff, summary = diff_products(products)
+    token = _preview_store().save({
+        'products': products,
+        'diff': diff,
+        'summary': summary,
+        'errors': errors,
+        'duplicate_count': duplicate_count,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    })
+    db.session.rollback()
+    return jsonify({
+        "success": True,
+        "dry_run": True,
+        "message": f"Preview: {summary['new']} new, {summary['changed']} changed, "
+                   f"{summary['missing']} not in file, {len(errors)} errors",
+        "token": token,
+        "expires_in": current_app.config['IMPORT_PREVIEW_TTL'],
+        "summary": summary,
+        "error_count": len(errors),
+        "errors": errors,
+        "duplicate_count": duplicate_count,
+        "diff": diff_page(diff, 1, request.args.get('per_page', 100, type=int)),
+        **extra
+    })
+
+
+def _parse_workbooks(paths):
+    from src.services.spreadsheet import parse_product_workbooks
+
+    return parse_product_workbooks(
+        paths,
+        max_workers=current_app.config['IMPORT_MAX_WORKERS'],
+        min_parallel_bytes=current_app.config['IMPORT_PARALLEL_MIN_BYTES']
+    )
+
+
+def _rebuild_catalog_snapshot():
+    if current_app.config['CATALOG_SNAPSHOT_ENABLED']:
+        build_snapshot(current_app.config['CATALOG_SNAPSHOT_PATH'])
+
+
+def _apply_import(products, errors, duplicate_count, **extra):
+    started = time.perf_counter()
+    success_count, update_count = apply_products(products)
+    if success_count > 0 or update_count > 0:
+        # Cached aggregates and exports embed product names and saldo_awal
+        bump_data_version()
+        db.session.commit()
+        _rebuild_catalog_snapshot()
+    write_seconds = time.perf_counter() - started
+    error_count = len(errors)
+
+    return jsonify({
+        "success": True,
+        "message": f"Import completed. {success_count} products imported, {update_count} products updated, {error_count} errors",
+        "success_count": success_count,
+        "update_count": update_count,
+        "error_count": error_count,
+        "duplicate_count": duplicate_count,
+        "errors": errors,
+        "write_seconds": round(write_seconds, 4),
+        **extra
+    })
+
+
+# ?dry_run=1 parses and diffs the upload without writing and returns a token;
+# POST again with ?token=<token> and no file to apply the previewed rows.
 @import_export_bp.route("/import/products", methods=["POST"])
+@bulk_route
 def import_products():
     try:
-        if "file" not in request.files:
-            return jsonify({"success": False, "message": "No file uploaded"}), 400
-
-        file = request.files["file"]
-        if file.filename == "":
-            return jsonify({"success": False, "message": "No file selected"}), 400
-
-        if not (file.filename.endswith('.xlsx') or file.filename.endswith('.xls')):
-            return jsonify({'success': False, 'message': 'File must be Excel format (.xlsx or .xls)'}), 400
-
-        df = pd.read_excel(file)
-
-        success_count = 0
-        update_count = 0
-        error_count = 0
-        errors = []
-
-        for index, row in df.iterrows():
-            row_num = index + 2  # For 1-based indexing and header row
-            try:
-                kode_produk = str(row['Kode']).strip()
-                nama_produk = str(row['Nama Barang']).strip()
-                saldo_awal = int(row['Jumlah'])
-
-                if not all([kode_produk, nama_produk, saldo_awal is not None]):
-                    errors.append(f"Row {row_num}: Missing or empty required fields (kode_produk, nama_produk, saldo_awal)")
-                    error_count += 1
-                    continue
-                
-                existing_product = Product.query.filter_by(kode_produk=kode_produk).first()
-                if existing_product:
-                    existing_product.nama_produk = nama_produk
-                    existing_product.saldo_awal = saldo_awal
-                    update_count += 1
-                else:
-                    product = Product(
-                        kode_produk=kode_produk,
-                        nama_produk=nama_produk,
-                        saldo_awal=saldo_awal
-                    )
-                    db.session.add(product)
-                    success_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {row_num}: {str(e)}")
-                error_count += 1
-        
-        if success_count > 0 or update_count > 0:
-            db.session.commit()
-        
+        from src.services.spreadsheet import merge_products
+
+        token = request.args.get('token')
+        if token:
+            store = _preview_store()
+            preview = store.load(token)
+            if preview is None:
+                return jsonify({"success": False, "message": "Preview not found or expired, upload the file again"}), 404
+            response = _apply_import(preview['products'], preview['errors'], preview['duplicate_count'],
+                                     previewed_at=preview['created_at'])
+            store.discard(token)
+            return response
+
+        upload_ids = request.args.getlist('upload')
+        if upload_ids:
+            # Finalized resumable uploads (see routes/uploads.py) are parsed in place
+            store = upload_store()
+            paths = [store.path(upload_id) for upload_id in upload_ids]
+            if not all(filename.lower().endswith(('.xlsx', '.xls')) for _, filename in paths):
+                return jsonify({'success': False, 'message': 'File must be Excel format (.xlsx or .xls), '
+                                                            'CSV files go to /api/import/products/csv'}), 400
+            started = time.perf_counter()
+            sheets = _parse_workbooks(paths)
+        else:
+            # Several workbooks may be sent, as repeated "file" or "files" fields
+            files = request.files.getlist("file") + request.files.getlist("files")
+            if not files:
+                return jsonify({"success": False, "message": "No file uploaded"}), 400
+
+            if any(file.filename == "" for file in files):
+                return jsonify({"success": False, "message": "No file selected"}), 400
+
+            if not all(file.filename.endswith(('.xlsx', '.xls')) for file in files):
+                return jsonify({'success': False, 'message': 'File must be Excel format (.xlsx or .xls), '
+                                                            'CSV files go to /api/import/products/csv'}), 400
+
+            # Sheets are parsed in worker processes, which read them from disk
+            started = time.perf_counter()
+            with tempfile.TemporaryDirectory(prefix='import_') as directory:
+                paths = []
+                for index, file in enumerate(files):
+                    path = os.path.join(directory, f"{index}_{secure_filename(file.filename) or 'upload.xlsx'}")
+                    file.save(path)
+                    paths.append((path, file.filename))
+                sheets = _parse_workbooks(paths)
+        parse_seconds = time.perf_counter() - started
+
+        products, duplicate_count = merge_products([sheet['products'] for sheet in sheets])
+        errors = [error for sheet in sheets for error in sheet['errors']]
+        report = {
+            "sheets": [
+                {key: sheet[key] for key in ('file', 'sheet', 'rows', 'valid', 'seconds')}
+                for sheet in sheets
+            ],
+            "parse_seconds": round(parse_seconds, 4)
+        }
+
+        if _is_dry_run():
+            response = _import_preview(products, errors, duplicate_count, **report)
+        else:
+            response = _apply_import(products, errors, duplicate_count, **report)
+        for upload_id in upload_ids:
+            store.discard(upload_id)
+        return response
+
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@import_export_bp.route("/import/preview/<token>", methods=["GET"])
+def import_preview(token):
+    try:
+        from src.services.import_preview import diff_page, STATUSES
+
+        preview = _preview_store().load(token)
+        if preview is None:
+            return jsonify({"success": False, "message": "Preview not found or expired, upload the file again"}), 404
+
+        status = request.args.get('status')
+        if status and status not in STATUSES:
+            return jsonify({"success": False, "message": f"status must be one of: {', '.join(STATUSES)}"}), 400
+
         return jsonify({
             "success": True,
-            "message": f"Import completed. {success_count} products imported, {update_count} products updated, {error_count} errors",
-            "success_count": success_count,
-            "update_count": update_count,
-            "error_count": error_count,
-            "errors": errors
+            "token": token,
+            "created_at": preview['created_at'],
+            "summary": preview['summary'],
+            "error_count": len(preview['errors']),
+            "diff": diff_page(
+                preview['diff'],
+                max(1, request.args.get('page', 1, type=int)),
+                max(1, request.args.get('per_page', 100, type=int)),
+                status
+            )
         })
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@import_export_bp.route("/import/preview/<token>", methods=["DELETE"])
+def discard_import_preview(token):
+    try:
+        _preview_store().discard(token)
+        return jsonify({"success": True, "message": "Preview discarded"})
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+def _import_csv(stream, filename):
+    from src.services.spreadsheet import CsvProductReader, drop_duplicate_products, merge_products
+
+    delimiter = request.args.get('delimiter')
+    reader = CsvProductReader(
+        stream,
+        filename,
+        encoding=request.args.get('encoding'),
+        delimiter='\t' if delimiter == 'tab' else delimiter,
+        chunk_rows=current_app.config['IMPORT_CSV_CHUNK_ROWS']
+    )
+
+    if _is_dry_run():
+        frames, errors = [], []
+        for products, chunk_errors, _ in reader:
+            frames.append(products)
+            errors += chunk_errors
+        products, duplicate_count = merge_products(frames)
+        return _import_preview(products, errors, duplicate_count, rows=reader.rows,
+                               encoding=reader.encoding, delimiter=reader.delimiter)
+
+    started = time.perf_counter()
+    errors = []
+    seen = set()
+    valid_count = success_count = 0
+    for products, chunk_errors, _ in reader:
+        errors += chunk_errors
+        valid_count += len(products)
+        # Within a chunk the last occurrence wins here; across chunks the
+        # later chunk simply updates the row the earlier one wrote
+        products = drop_duplicate_products(products)
+        seen.update(products['kode_produk'].tolist())
+        inserted, _ = apply_products(products)
+        success_count += inserted
+
+    if reader.rows == 0 and not errors:
+        return jsonify({"success": False, "message": "No data rows found"}), 400
+
+    update_count = len(seen) - success_count
+    if seen:
+        # Cached aggregates and exports embed product names and saldo_awal
+        bump_data_version()
+        db.session.commit()
+        _rebuild_catalog_snapshot()
+    seconds = time.perf_counter() - started
+    error_count = len(errors)
+
+    return jsonify({
+        "success": True,
+        "message": f"Import completed. {success_count} products imported, {update_count} products updated, {error_count} errors",
+        "success_count": success_count,
+        "update_count": update_count,
+        "error_count": error_count,
+        "duplicate_count": valid_count - len(seen),
+        "errors": errors,
+        "rows": reader.rows,
+        "encoding": reader.encoding,
+        "delimiter": reader.delimiter,
+        "seconds": round(seconds, 4),
+        "rows_per_second": round(reader.rows / seconds) if seconds else None
+    })
+
+
+# CSV/TSV import. The file is either the raw request body, read as it arrives
+# (curl --data-binary @produk.csv), or a multipart upload in the "file" field.
+# Encoding and delimiter are detected unless ?encoding= / ?delimiter= are given.
+# Rows are validated and written in chunks inside one transaction, so memory
+# stays flat however large the file is. ?dry_run=1 previews the file instead,
+# like the Excel import.
+@import_export_bp.route("/import/products/csv", methods=["POST"])
+@bulk_route
+def import_products_csv():
+    try:
+        upload_id = request.args.get('upload')
+        if upload_id:
+            # A finalized resumable upload (see routes/uploads.py), read in place
+            store = upload_store()
+            path, filename = store.path(upload_id)
+            if not filename.lower().endswith(('.csv', '.tsv', '.txt')):
+                return jsonify({'success': False, 'message': 'File must be CSV format (.csv or .tsv)'}), 400
+            with open(path, 'rb') as stream:
+                response = _import_csv(stream, filename)
+            store.discard(upload_id)
+            return response
+
+        if request.mimetype == 'multipart/form-data':
+            file = request.files.get("file")
+            if file is None:
+                return jsonify({"success": False, "message": "No file uploaded"}), 400
+            if file.filename == "":
+                return jsonify({"success": False, "message": "No file selected"}), 400
+            if not file.filename.lower().endswith(('.csv', '.tsv', '.txt')):
+                return jsonify({'success': False, 'message': 'File must be CSV format (.csv or .tsv)'}), 400
+            stream, filename = file.stream, file.filename
+        else:
+            stream, filename = request.stream, request.args.get('filename', '')
+
+        return _import_csv(stream, filename)
+
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+def _import_session_counts(session_id, stream, filename):
+    from src.services.count_import import COUNT_MODES, import_counts
+    from src.services.spreadsheet import read_count_file, normalize_counts
+
+    mode = request.args.get('mode', 'overwrite')
+    if mode not in COUNT_MODES:
+        return jsonify({'success': False, 'message': f"mode must be one of: {', '.join(COUNT_MODES)}"}), 400
+
+    started = time.perf_counter()
+    delimiter = request.args.get('delimiter')
+    frame, first_row = read_count_file(
+        stream,
+        filename,
+        encoding=request.args.get('encoding'),
+        delimiter='\t' if delimiter == 'tab' else delimiter
+    )
+    if frame.empty:
+        return jsonify({"success": False, "message": "No data rows found"}), 400
+    counts, errors = normalize_counts(frame, first_row)
+
+    result = import_counts(session_id, counts, mode)
+    db.session.commit()
+    seconds = time.perf_counter() - started
+
+    return jsonify({
+        "success": True,
+        "message": f"Import completed. {result['inserted']} products counted, {result['updated']} updated, "
+                   f"{result['unknown_count']} unknown codes, {len(errors)} errors",
+        "mode": mode,
+        "rows": len(frame),
+        "error_count": len(errors),
+        "errors": errors,
+        **result,
+        "seconds": round(seconds, 4)
+    })
+
+
+# Counted quantities from a handheld scanner export ("kode, qty" as CSV/TSV or
+# XLSX), sent as the "file" field, the raw body (?filename=) or ?upload=<id>;
+# ?mode=overwrite (default) replaces counts already recorded, ?mode=add adds.
+@import_export_bp.route('/sessions/<int:session_id>/import', methods=['POST'])
+@bulk_route
+def import_session_counts(session_id):
+    try:
+        session = StockOpnameSession.query.get_or_404(session_id)
         
+        if session.status == 'completed':
+            return jsonify({'success': False, 'message': 'Sesi sudah selesai'}), 400
+        
+        upload_id = request.args.get('upload')
+        if upload_id:
+            store = upload_store()
+            path, filename = store.path(upload_id)
+            with open(path, 'rb') as stream:
+                response = _import_session_counts(session_id, stream, filename)
+            store.discard(upload_id)
+            return response
+
+        if request.mimetype == 'multipart/form-data':
+            file = request.files.get("file")
+            if file is None:
+                return jsonify({"success": False, "message": "No file uploaded"}), 400
+            if file.filename == "":
+                return jsonify({"success": False, "message": "No file selected"}), 400
+            stream, filename = file.stream, file.filename
+        else:
+            stream, filename = request.stream, request.args.get('filename', '')
+
+        return _import_session_counts(session_id, stream, filename)
+
+    except UploadError as e:
+        return upload_error(e)
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": str(e)}), 500
 
 
 @import_export_bp.route('/export/products', methods=['GET'])
+@bulk_route
+@read_replica
 def export_products():
     try:
         products = Product.query.all()
@@ -108,10 +439,12 @@ def export_products():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @import_export_bp.route('/sessions/<int:session_id>/export', methods=['GET'])
+@bulk_route
+@read_replica
 def export_session_csv(session_id):
     try:
         session = StockOpnameSession.query.get_or_404(session_id)
-        details = StockOpnameDetail.query.filter_by(session_id=session_id).all()
+        details = session_detail_rows(session_id)
         
         output = io.StringIO()
         writer = csv.writer(output)
@@ -125,9 +458,9 @@ def export_session_csv(session_id):
         # Write data
         for detail in details:
             writer.writerow([
-                detail.product.kode_produk,
-                detail.product.nama_produk,
-                detail.product.saldo_awal,
+                detail.kode_produk,
+                detail.nama_produk,
+                detail.saldo_awal,
                 detail.jumlah_barang,
                 detail.catatan or "",
                 detail.created_at.strftime("%Y-%m-%d %H:%M:%S") if detail.created_at else ""
@@ -145,51 +478,17 @@ def export_session_csv(session_id):
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @import_export_bp.route('/export/stock-opname/<int:session_id>/excel', methods=['GET'])
+@bulk_route
+@read_replica
 def export_session_excel(session_id):
     try:
         session = StockOpnameSession.query.get_or_404(session_id)
-        details = StockOpnameDetail.query.filter_by(session_id=session_id).all()
-        
-        # Prepare data for Excel
-        data = []
-        for detail in details:
-            data.append({
-                'Kode Produk': detail.product.kode_produk,
-                "Nama Produk": detail.product.nama_produk,
-                "Saldo Awal": detail.product.saldo_awal,
-                "Jumlah Barang": detail.jumlah_barang,
-                'Catatan': detail.catatan or '',
-                'Waktu Input': detail.created_at.strftime('%Y-%m-%d %H:%M:%S') if detail.created_at else ''
-            })
-        
-        # Create DataFrame
-        df = pd.DataFrame(data)
-        
-        # Create Excel file in memory
-        output = io.BytesIO()
-        
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            # Write main data
-            df.to_excel(writer, sheet_name='Stock Opname', index=False)
-            
-            # Write summary sheet
-            summary_data = {
-                'Informasi': ['Lokasi', 'Waktu Mulai', 'Waktu Selesai', 'Status', 'Total Item'],
-                'Detail': [
-                    session.lokasi,
-                    session.waktu_mulai.strftime('%Y-%m-%d %H:%M:%S') if session.waktu_mulai else '',
-                    session.waktu_selesai.strftime('%Y-%m-%d %H:%M:%S') if session.waktu_selesai else 'Belum selesai',
-                    session.status,
-                    len(details)
-                ]
-            }
-            summary_df = pd.DataFrame(summary_data)
-            summary_df.to_excel(writer, sheet_name='Summary', index=False)
-        
-        output.seek(0)
+        # Completed sessions are served from the render cache
+        data = render_session(session.id, session.status, session.waktu_selesai, data_version(),
+                              lambda: session_export_data(session))
         
         # Create response
-        response = make_response(output.getvalue())
+        response = make_response(data)
         response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         response.headers['Content-Disposition'] = f'attachment; filename=stock_opname_{session.lokasi}_{session_id}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
         
@@ -198,11 +497,72 @@ def export_session_excel(session_id):
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _sessions_started_between(start, end, status):
+    query = db.select(
+        StockOpnameSession.id, StockOpnameSession.lokasi, StockOpnameSession.status,
+        StockOpnameSession.waktu_mulai, StockOpnameSession.waktu_selesai
+    )
+    if start is not None:
+        query = query.where(StockOpnameSession.waktu_mulai >= start)
+    if end is not None:
+        query = query.where(StockOpnameSession.waktu_mulai < end)
+    if status is not None:
+        query = query.where(StockOpnameSession.status == status)
+    return [row._asdict() for row in db.session.execute(query)]
+
+# Month-end export: GET /api/export/sessions.zip?from=2024-06-01&to=2024-07-01
+# holds the Excel export of every session started in [from, to);
+# ?status=completed (default), active or all.
+@import_export_bp.route('/export/sessions.zip', methods=['GET'])
+@bulk_route
+@read_replica
+def export_sessions_zip():
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        status = request.args.get('status', 'completed')
+        
+        if not start and not end:
+            return jsonify({'success': False, 'message': 'from or to is required'}), 400
+        if status not in ('completed', 'active', 'all'):
+            return jsonify({'success': False, 'message': 'status must be completed, active or all'}), 400
+        try:
+            start = datetime.fromisoformat(start) if start else None
+            end = datetime.fromisoformat(end) if end else None
+        except ValueError:
+            return jsonify({'success': False, 'message': 'from and to must be ISO dates (YYYY-MM-DD)'}), 400
+        
+        sessions = sorted(
+            (dict(session, shard=shard)
+             for shard, found in fan_out(_sessions_started_between, start, end, None if status == 'all' else status)
+             for session in found),
+            key=lambda session: (session['waktu_mulai'], session['id'])
+        )
+        if not sessions:
+            return jsonify({'success': False, 'message': 'Tidak ada sesi pada periode tersebut'}), 404
+        
+        def load(session):
+            return run_on_shard(session['shard'], load_session_export, session['id'])
+        
+        response = Response(
+            stream_with_context(stream_sessions_zip(
+                sessions, load, data_version(), current_app.config['EXPORT_MAX_WORKERS']
+            )),
+            mimetype='application/zip'
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename=stock_opname_sessions_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+        return response
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @import_export_bp.route("/template/products", methods=["GET"])
 def download_template():
     try:
+        import pandas as pd
+
         # Define the headers for your Excel template
-        headers = ["kode_produk", "nama_produk", "saldo_awal"]
+        headers = ["kode_produk", "nama_produk", "saldo_awal", "barcode"]
         
         # Create an empty DataFrame with these headers
         df = pd.DataFrame(columns=headers)
@@ -226,8 +586,12 @@ def download_template():
 
 
 @import_export_bp.route("/export/products/excel", methods=["GET"])
+@bulk_route
+@read_replica
 def export_products_excel():
     try:
+        import pandas as pd
+
         products = Product.query.all()
 
         # Prepare data for Excel
@@ -264,8 +628,10 @@ def export_products_excel():
 @import_export_bp.route("/template/products/excel", methods=["GET"])
 def download_excel_template():
     try:
+        import pandas as pd
+
         # Define the headers for your Excel template
-        headers = ["Kode", "Nama Barang", "Jumlah"]
+        headers = ["Kode", "Nama Barang", "Jumlah", "Barcode"]
         
         # Create an empty DataFrame with these headers
         df = pd.DataFrame(columns=headers)
@@ -0,0 +1,198 @@
+from flask import Blueprint, request, jsonify, Response, current_app, stream_with_context
+from src.models.stock_opname import db, Product, StockOpnameSession, StockOpnameDetail, SessionArchive
+from src.services.cache import LRUCache
+from src.services.data_version import data_version
+from src.services.details import archived_aggregate_rows
+from src.services.queries import prefix_filter, parse_id_list
+from src.services.replica import read_replica
+from src.services.scheduling import bulk_route
+from src.services.sharding import fan_out
+from sqlalchemy import func
+import heapq
+import json
+
+report_bp = Blueprint('report', __name__)
+
+# Aggregates over completed sessions never change (details are frozen once a
+# session is completed), so their rendered JSON is kept per worker, keyed on
+# the shared data version that product imports, deletes and restores replace.
+aggregate_cache = LRUCache(maxsize=64)
+
+
+def _aggregate_query(session_ids):
+    return (
+        db.select(
+            Product.id,
+            Product.kode_produk,
+            Product.nama_produk,
+            Product.saldo_awal,
+            StockOpnameSession.lokasi,
+            func.sum(StockOpnameDetail.jumlah_barang).label('jumlah_barang'),
+        )
+        .select_from(StockOpnameDetail)
+        .join(Product, Product.id == StockOpnameDetail.product_id)
+        .join(StockOpnameSession, StockOpnameSession.id == StockOpnameDetail.session_id)
+        .where(StockOpnameDetail.session_id.in_(session_ids))
+        .group_by(Product.id, StockOpnameSession.lokasi)
+        .order_by(Product.kode_produk, StockOpnameSession.lokasi)
+    )
+
+
+def _row_order(row):
+    return row[1], row[4]
+
+
+def _aggregate_rows(sessions):
+    """Per (product, lokasi) totals of ``sessions``, ordered by kode_produk, lokasi."""
+    session_ids = [session['id'] for session in sessions]
+
+    # Archived sessions no longer have rows in stock_opname_details; their
+    # totals are merged into the query's (kode_produk, lokasi) order
+    archives = db.session.execute(
+        db.select(SessionArchive).where(SessionArchive.session_id.in_(session_ids))
+    ).scalars().all()
+    archived_ids = {archive.session_id for archive in archives}
+    hot_ids = [session_id for session_id in session_ids if session_id not in archived_ids]
+
+    rows = db.session.execute(
+        _aggregate_query(hot_ids).execution_options(yield_per=1000)
+    ) if hot_ids else []
+    if archives:
+        lokasi_by_session = {session['id']: session['lokasi'] for session in sessions}
+        rows = heapq.merge(rows, archived_aggregate_rows(archives, lokasi_by_session), key=_row_order)
+    return rows
+
+
+def _shard_aggregate_rows(sessions):
+    return list(_aggregate_rows(sessions))
+
+
+def _generate_aggregate(sessions):
+    yield '{"success": true, "sessions": %s, "data": [' % json.dumps(sessions)
+
+    totals = {'total_skus': 0, 'total_jumlah_barang': 0, 'total_saldo_awal': 0, 'total_variance': 0}
+    current = None
+
+    def emit(item):
+        totals['total_skus'] += 1
+        totals['total_jumlah_barang'] += item['total_jumlah_barang']
+        totals['total_saldo_awal'] += item['saldo_awal']
+        item['variance'] = item['total_jumlah_barang'] - item['saldo_awal']
+        totals['total_variance'] += item['variance']
+        return (',' if totals['total_skus'] > 1 else '') + json.dumps(item)
+
+    if current_app.config.get('SHARDS'):
+        # Each shard aggregates its own sessions; the same product counted
+        # in several shards is combined by the grouping below
+        rows = heapq.merge(*(rows for _, rows in fan_out(_shard_aggregate_rows, sessions)), key=_row_order)
+    else:
+        rows = _aggregate_rows(sessions)
+
+    for product_id, kode_produk, nama_produk, saldo_awal, lokasi, jumlah_barang in rows:
+        if current is None or current['product_id'] != product_id:
+            if current is not None:
+                yield emit(current)
+            current = {
+                'product_id': product_id,
+                'kode_produk': kode_produk,
+                'nama_produk': nama_produk,
+                'saldo_awal': saldo_awal,
+                'total_jumlah_barang': 0,
+                'locations': [],
+            }
+        current['total_jumlah_barang'] += jumlah_barang
+        if current['locations'] and current['locations'][-1]['lokasi'] == lokasi:
+            current['locations'][-1]['jumlah_barang'] += jumlah_barang
+        else:
+            current['locations'].append({'lokasi': lokasi, 'jumlah_barang': jumlah_barang})
+    if current is not None:
+        yield emit(current)
+
+    yield '], "summary": %s}' % json.dumps(totals)
+
+
+def _execute_all(query):
+    return db.session.execute(query).all()
+
+
+@report_bp.route('/aggregate', methods=['GET'])
+@bulk_route
+@read_replica
+def aggregate_sessions():
+    try:
+        session_ids = parse_id_list(request.args.getlist('sessions'))
+        lokasi_prefix = request.args.get('lokasi_prefix', '', type=str)
+
+        if not session_ids and not lokasi_prefix:
+            return jsonify({'success': False, 'message': 'sessions or lokasi_prefix is required'}), 400
+
+        query = db.select(
+            StockOpnameSession.id, StockOpnameSession.lokasi, StockOpnameSession.status
+        ).order_by(StockOpnameSession.id)
+        if session_ids:
+            query = query.where(StockOpnameSession.id.in_(session_ids))
+        if lokasi_prefix:
+            query = query.where(prefix_filter(StockOpnameSession.lokasi, lokasi_prefix))
+
+        sessions = [
+            {'id': id, 'lokasi': lokasi, 'status': status}
+            for id, lokasi, status in sorted(
+                row for _, rows in fan_out(_execute_all, query) for row in rows
+            )
+        ]
+
+        cache_key = None
+        if sessions and all(session['status'] == 'completed' for session in sessions):
+            cache_key = (data_version(), tuple(session['id'] for session in sessions))
+            cached = aggregate_cache.get(cache_key)
+            if cached is not None:
+                return Response(cached, mimetype='application/json')
+
+        def generate():
+            chunks = []
+            for chunk in _generate_aggregate(sessions):
+                if cache_key is not None:
+                    chunks.append(chunk)
+                yield chunk
+            if cache_key is not None:
+                aggregate_cache.set(cache_key, ''.join(chunks))
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+    except ValueError:
+        return jsonify({'success': False, 'message': 'sessions must be a comma separated list of ids'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@report_bp.route('/sessions/<int:session_id>/analytics', methods=['GET'])
+@bulk_route
+@read_replica
+def get_session_analytics(session_id):
+    try:
+        from src.services.analytics import load_session_arrays, compute_analytics
+
+        session = StockOpnameSession.query.get_or_404(session_id)
+        z_threshold = request.args.get('z', 3.0, type=float)
+        limit = request.args.get('limit', 20, type=int)
+
+        analytics = compute_analytics(*load_session_arrays(session_id), z_threshold=z_threshold, limit=limit)
+
+        # Attach product code and name to the few SKUs that are listed
+        listed = analytics['outliers'] + analytics['top_losses']
+        product_ids = {item['product_id'] for item in listed}
+        products = {
+            id: (kode_produk, nama_produk)
+            for id, kode_produk, nama_produk in db.session.execute(
+                db.select(Product.id, Product.kode_produk, Product.nama_produk).where(Product.id.in_(product_ids))
+            )
+        } if product_ids else {}
+        for item in listed:
+            item['kode_produk'], item['nama_produk'] = products.get(item['product_id'], (None, None))
+
+        return jsonify({
+            'success': True,
+            'session': {'id': session.id, 'lokasi': session.lokasi, 'status': session.status},
+            'data': analytics
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
@@ -1,7 +1,19 @@
-from flask import Blueprint, request, jsonify
-from src.models.stock_opname import db, Product, StockOpnameSession, StockOpnameDetail
+from flask import Blueprint, request, jsonify, current_app, g
+from src.models.stock_opname import db, Product, ProductBarcode, StockOpnameSession, StockOpnameDetail
 from datetime import datetime
 from sqlalchemy import or_
+import heapq
+import math
+from src.services.details import DetailRow, session_detail_rows, session_item_counts, detail_dict
+from src.services.group_commit import group_commit_writer
+from src.services.catalog_snapshot import load_snapshot
+from src.services.queries import prefix_filter
+from src.services.replica import read_replica
+from src.services.scheduling import bulk_route
+from src.services.purge import delete_sessions, sessions_between
+from src.services.data_version import publish_data_version
+from src.services.sharding import assign_session_shard, fan_out
+from src.services.session_book import parse_book_scope, snapshot_book
 
 stock_opname_bp = Blueprint('stock_opname', __name__)
 
@@ -100,14 +112,153 @@ def search_products():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def catalog_snapshot():
+    if not current_app.config['CATALOG_SNAPSHOT_ENABLED']:
+        return None
+    return load_snapshot(current_app.config['CATALOG_SNAPSHOT_PATH'])
+
+# Code lookups for scanners. Served from the catalog snapshot (see
+# src/services/catalog_snapshot.py), rebuilt after imports; products created
+# since are looked up in the database.
+@stock_opname_bp.route('/products/code/<path:kode_produk>', methods=['GET'])
+def get_product_by_code(kode_produk):
+    try:
+        snapshot = catalog_snapshot()
+        product = snapshot.get(kode_produk) if snapshot is not None else None
+        if product is None:
+            found = Product.query.filter_by(kode_produk=kode_produk).first()
+            if not found:
+                return jsonify({'success': False, 'message': 'Produk tidak ditemukan'}), 404
+            product = found.to_dict()
+        
+        return jsonify({'success': True, 'data': product})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@stock_opname_bp.route('/products/code', methods=['GET'])
+def search_products_by_code_prefix():
+    try:
+        prefix = request.args.get('prefix', '', type=str)
+        limit = request.args.get('limit', 10, type=int)
+        
+        if not prefix:
+            return jsonify({'success': True, 'data': []})
+        
+        snapshot = catalog_snapshot()
+        if snapshot is not None:
+            # Products created since the snapshot was built have higher ids
+            newer = [
+                product.to_dict() for product in Product.query.filter(
+                    Product.id > snapshot.max_id, prefix_filter(Product.kode_produk, prefix)
+                ).order_by(Product.kode_produk).limit(limit)
+            ]
+            products = list(heapq.merge(
+                snapshot.prefix(prefix, limit), newer, key=lambda product: product['kode_produk'].encode()
+            ))[:limit]
+        else:
+            products = [
+                product.to_dict() for product in Product.query.filter(
+                    prefix_filter(Product.kode_produk, prefix)
+                ).order_by(Product.kode_produk).limit(limit)
+            ]
+        
+        return jsonify({'success': True, 'data': products})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# Scanner lookups: an exact match on a product barcode (unique index on
+# product_barcodes.barcode), then on kode_produk for labels printed with the code
+@stock_opname_bp.route('/scan/<path:barcode>', methods=['GET'])
+def scan_barcode(barcode):
+    try:
+        barcode = barcode.strip()
+        product = db.session.execute(
+            db.select(Product)
+            .join(ProductBarcode, ProductBarcode.product_id == Product.id)
+            .where(ProductBarcode.barcode == barcode)
+        ).scalar_one_or_none()
+        if product is not None:
+            return jsonify({'success': True, 'matched': 'barcode', 'data': product.to_dict()})
+        
+        snapshot = catalog_snapshot()
+        found = snapshot.get(barcode) if snapshot is not None else None
+        if found is None:
+            product = Product.query.filter_by(kode_produk=barcode).first()
+            if not product:
+                return jsonify({'success': False, 'message': 'Produk tidak ditemukan'}), 404
+            found = product.to_dict()
+        
+        return jsonify({'success': True, 'matched': 'kode_produk', 'data': found})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 # Session routes
+def _session_filters(args):
+    """Filters of the session list; every combination is served by an index.
+
+    ?status=active|completed, ?lokasi= (exact), ?lokasi_prefix=, ?created_by=
+    and ?from=/?to= (ISO dates, sessions started in [from, to)). Raises
+    ValueError on an invalid status or date.
+    """
+    filters = []
+    status = args.get('status')
+    if status:
+        if status not in ('active', 'completed'):
+            raise ValueError('status must be active or completed')
+        filters.append(StockOpnameSession.status == status)
+    if args.get('lokasi'):
+        filters.append(StockOpnameSession.lokasi == args['lokasi'])
+    if args.get('lokasi_prefix'):
+        filters.append(prefix_filter(StockOpnameSession.lokasi, args['lokasi_prefix']))
+    if args.get('created_by'):
+        filters.append(StockOpnameSession.created_by == args['created_by'])
+    try:
+        if args.get('from'):
+            filters.append(StockOpnameSession.waktu_mulai >= datetime.fromisoformat(args['from']))
+        if args.get('to'):
+            filters.append(StockOpnameSession.waktu_mulai < datetime.fromisoformat(args['to']))
+    except ValueError:
+        raise ValueError('from and to must be ISO dates (YYYY-MM-DD)')
+    return filters
+
+def _session_dicts(sessions):
+    counts = session_item_counts([session.id for session in sessions])
+    return [session.to_dict(counts[session.id]) for session in sessions]
+
+def _shard_sessions(filters, limit):
+    query = StockOpnameSession.query.filter(*filters).order_by(StockOpnameSession.waktu_mulai.desc())
+    return query.count(), _session_dicts(query.limit(limit).all())
+
 @stock_opname_bp.route('/sessions', methods=['GET'])
 def get_sessions():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
-        
-        sessions = StockOpnameSession.query.order_by(
+        try:
+            filters = _session_filters(request.args)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        if current_app.config.get('SHARDS'):
+            # Newest first across every warehouse shard: each shard returns
+            # its first page * per_page sessions and the lists are merged
+            results = [result for _, result in fan_out(_shard_sessions, filters, page * per_page)]
+            total = sum(count for count, _ in results)
+            merged = heapq.merge(*(sessions for _, sessions in results),
+                                 key=lambda session: session['waktu_mulai'] or '', reverse=True)
+            items = list(merged)[(page - 1) * per_page:page * per_page]
+            return jsonify({
+                'success': True,
+                'data': items,
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': total,
+                    'pages': math.ceil(total / per_page) if per_page else 0
+                }
+            })
+        
+        sessions = StockOpnameSession.query.filter(*filters).order_by(
             StockOpnameSession.waktu_mulai.desc()
         ).paginate(
             page=page, 
@@ -117,7 +268,7 @@ def get_sessions():
         
         return jsonify({
             'success': True,
-            'data': [session.to_dict() for session in sessions.items],
+            'data': _session_dicts(sessions.items),
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -135,24 +286,104 @@ def create_session():
         
         if 'lokasi' not in data or not data['lokasi']:
             return jsonify({'success': False, 'message': 'Lokasi is required'}), 400
+        try:
+            book_scope = parse_book_scope(data.get('book'))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
         session = StockOpnameSession(
             lokasi=data['lokasi'],
             created_by=data.get('created_by', 'system')
         )
+        if current_app.config.get('SHARDS'):
+            # Picks the warehouse shard and routes the rest of the request there
+            session.id = assign_session_shard(data['lokasi'], data.get('warehouse'))
         
         db.session.add(session)
+        book_items = 0
+        if book_scope is not None:
+            # Freeze the book quantities this session's variance is measured against
+            db.session.flush()
+            book_items = snapshot_book(session.id, *book_scope)
         db.session.commit()
         
         return jsonify({
             'success': True,
             'message': 'Sesi stock opname berhasil dibuat',
-            'data': session.to_dict()
+            'data': session.to_dict(),
+            'book_items': book_items
         }), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@stock_opname_bp.route('/sessions/<int:session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    try:
+        StockOpnameSession.query.get_or_404(session_id)
+        db.session.close()
+        
+        _, details_deleted = delete_sessions(
+            [session_id], current_app.config['ARCHIVE_DIR'], current_app.config['DELETE_CHUNK_ROWS']
+        )
+        publish_data_version()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Sesi stock opname berhasil dihapus',
+            'details_deleted': details_deleted
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+# Purge by date range: DELETE /api/sessions?from=2024-01-01&to=2024-07-01
+# matches sessions started in [from, to); ?status=completed (default), active
+# or all; ?dry_run=1 only lists the matching session ids.
+@stock_opname_bp.route('/sessions', methods=['DELETE'])
+@bulk_route
+def purge_sessions():
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        status = request.args.get('status', 'completed')
+        
+        if not start and not end:
+            return jsonify({'success': False, 'message': 'from or to is required'}), 400
+        if status not in ('completed', 'active', 'all'):
+            return jsonify({'success': False, 'message': 'status must be completed, active or all'}), 400
+        try:
+            start = datetime.fromisoformat(start) if start else None
+            end = datetime.fromisoformat(end) if end else None
+        except ValueError:
+            return jsonify({'success': False, 'message': 'from and to must be ISO dates (YYYY-MM-DD)'}), 400
+        
+        # Every warehouse shard is searched and purged in parallel
+        session_ids = sorted(
+            session_id
+            for _, ids in fan_out(sessions_between, start, end, None if status == 'all' else status)
+            for session_id in ids
+        )
+        if request.args.get('dry_run', '').lower() in ('1', 'true', 'yes'):
+            return jsonify({'success': True, 'dry_run': True, 'session_ids': session_ids})
+        
+        deleted = [result for _, result in fan_out(
+            delete_sessions, session_ids, current_app.config['ARCHIVE_DIR'], current_app.config['DELETE_CHUNK_ROWS']
+        )]
+        sessions_deleted = sum(sessions for sessions, _ in deleted)
+        details_deleted = sum(details for _, details in deleted)
+        publish_data_version()
+        
+        return jsonify({
+            'success': True,
+            'message': f'{sessions_deleted} sesi dihapus',
+            'sessions_deleted': sessions_deleted,
+            'details_deleted': details_deleted
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
 @stock_opname_bp.route('/sessions/<int:session_id>/complete', methods=['PUT'])
 def complete_session(session_id):
     try:
@@ -177,16 +408,18 @@ def complete_session(session_id):
 
 # Detail routes
 @stock_opname_bp.route('/sessions/<int:session_id>/details', methods=['GET'])
+@read_replica
 def get_session_details(session_id):
     try:
         session = StockOpnameSession.query.get_or_404(session_id)
         
-        details = StockOpnameDetail.query.filter_by(session_id=session_id).all()
+        # Also serves archived sessions, whose details left the hot table
+        details = session_detail_rows(session_id)
         
         return jsonify({
             'success': True,
             'session': session.to_dict(),
-            'data': [detail.to_dict() for detail in details]
+            'data': [detail_dict(detail) for detail in details]
         })
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)}), 500
@@ -212,6 +445,28 @@ def add_session_detail(session_id):
         if not product:
             return jsonify({'success': False, 'message': 'Produk tidak ditemukan'}), 404
         
+        if current_app.config['GROUP_COMMIT_ENABLED']:
+            # Written and committed together with other scans by the worker's writer thread
+            product_id = product.id
+            product_columns = (product.kode_produk, product.nama_produk, product.saldo_awal, product.created_at)
+            db.session.close()
+            future = group_commit_writer().submit({
+                'session_id': session_id,
+                'product_id': product_id,
+                'jumlah_barang': data['jumlah_barang'],
+                'catatan': data.get('catatan', '')
+            }, shard=g.get('shard'))
+            try:
+                row = future.result(timeout=current_app.config['GROUP_COMMIT_TIMEOUT'])
+            except TimeoutError:
+                return jsonify({'success': False, 'message': 'Penyimpanan data timeout, silakan coba lagi'}), 503
+            
+            return jsonify({
+                'success': True,
+                'message': 'Data berhasil direkam',
+                'data': detail_dict(DetailRow(*row, *product_columns))
+            }), 201
+        
         # Check if detail already exists for this product in this session
         existing_detail = StockOpnameDetail.query.filter_by(
             session_id=session_id,
@@ -0,0 +1,84 @@
+from flask import Blueprint, request, jsonify, current_app
+from src.services.uploads import UploadStore, UploadError
+
+# Resumable uploads for large import files:
+#   POST /api/uploads                 {"filename", "size", "sha256"?} -> {"id", "offset": 0}
+#   PUT  /api/uploads/<id>?offset=N   raw bytes (or an Upload-Offset header)
+#   GET  /api/uploads/<id>            current offset, to resume after a drop
+#   POST /api/uploads/<id>/finalize   {"sha256"} -> verified and complete
+# then POST /api/import/products?upload=<id> or /api/import/products/csv?upload=<id>.
+uploads_bp = Blueprint('uploads', __name__)
+
+
+def upload_store():
+    config = current_app.config
+    return UploadStore(config['UPLOAD_DIR'], config['UPLOAD_TTL'], config['UPLOAD_MAX_BYTES'])
+
+
+def upload_error(e):
+    return jsonify({'success': False, 'message': str(e), **e.details}), e.status
+
+
+@uploads_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    try:
+        data = request.get_json(silent=True) or {}
+        upload = upload_store().create(data.get('filename'), data.get('size'), data.get('sha256'))
+        return jsonify({'success': True, 'data': upload}), 201
+
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@uploads_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    try:
+        store = upload_store()
+        upload = store.get(upload_id)
+        if upload is None:
+            return jsonify({'success': False, 'message': 'Upload not found or expired'}), 404
+        return jsonify({'success': True, 'data': store.status(upload)})
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@uploads_bp.route('/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+def write_upload(upload_id):
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            offset = request.headers.get('Upload-Offset', type=int)
+        # request.stream is the socket: the body is copied to disk as it arrives
+        upload = upload_store().write(upload_id, offset, request.stream)
+        return jsonify({'success': True, 'data': upload})
+
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@uploads_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    try:
+        data = request.get_json(silent=True) or {}
+        upload = upload_store().finalize(upload_id, data.get('sha256'))
+        return jsonify({'success': True, 'data': upload})
+
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@uploads_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    try:
+        upload_store().discard(upload_id)
+        return jsonify({'success': True, 'message': 'Upload deleted'})
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
@@ -0,0 +1,115 @@
+from itertools import chain
+
+import numpy as np
+
+from src.models.stock_opname import db, Product, StockOpnameDetail
+from src.services.details import session_archive, session_detail_rows
+from src.services.session_book import BOOK_SALDO_AWAL, join_book
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+def load_session_arrays(session_id):
+    """Load ``(product_id, saldo_awal, jumlah_barang)`` for a session as int64 arrays.
+
+    A single query; rows are flattened straight into one NumPy buffer instead
+    of being hydrated into ORM objects. Archived sessions are read from their
+    archive file. ``saldo_awal`` is the session's snapshotted book quantity
+    where one was taken.
+    """
+    if session_archive(session_id) is not None:
+        rows = (
+            (row.product_id, row.saldo_awal, row.jumlah_barang)
+            for row in session_detail_rows(session_id) if row.saldo_awal is not None
+        )
+    else:
+        rows = db.session.execute(
+            join_book(
+                db.select(StockOpnameDetail.product_id, BOOK_SALDO_AWAL, StockOpnameDetail.jumlah_barang)
+                .join(Product, Product.id == StockOpnameDetail.product_id)
+            )
+            .where(StockOpnameDetail.session_id == session_id)
+        )
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.int64)
+    table = flat.reshape(-1, 3)
+    return table[:, 0], table[:, 1], table[:, 2]
+
+
+def _top(product_ids, score, mask, limit):
+    """Product ids and scores of the ``limit`` largest ``score`` values under ``mask``."""
+    candidates = np.flatnonzero(mask)
+    if candidates.size > limit:
+        candidates = candidates[np.argpartition(score[candidates], -limit)[-limit:]]
+    candidates = candidates[np.argsort(score[candidates])[::-1]]
+    return product_ids[candidates], candidates
+
+
+def compute_analytics(product_ids, saldo_awal, jumlah_barang, z_threshold=3.0, limit=20):
+    """Variance statistics for one session, computed with vectorized operations only."""
+    count = int(product_ids.size)
+    variance = jumlah_barang - saldo_awal
+
+    result = {
+        'total_items': count,
+        'total_saldo_awal': int(saldo_awal.sum()),
+        'total_jumlah_barang': int(jumlah_barang.sum()),
+        'total_variance': int(variance.sum()),
+        'matched': int(np.count_nonzero(variance == 0)),
+        'shortage': int(np.count_nonzero(variance < 0)),
+        'surplus': int(np.count_nonzero(variance > 0)),
+        'variance_percentiles': {},
+        'variance_pct_percentiles': {},
+        'outliers': [],
+        'round_numbers': {},
+        'top_losses': [],
+    }
+    if count == 0:
+        return result
+
+    result['variance_percentiles'] = {
+        f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(variance, PERCENTILES))
+    }
+    has_book = saldo_awal > 0
+    if has_book.any():
+        variance_pct = variance[has_book] / saldo_awal[has_book] * 100.0
+        result['variance_pct_percentiles'] = {
+            f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(variance_pct, PERCENTILES))
+        }
+
+    mean = variance.mean()
+    std = variance.std()
+    result['variance_mean'] = float(mean)
+    result['variance_std'] = float(std)
+    if std > 0:
+        z_scores = (variance - mean) / std
+        abs_z = np.abs(z_scores)
+        ids, idx = _top(product_ids, abs_z, abs_z > z_threshold, limit)
+        result['outliers_total'] = int(np.count_nonzero(abs_z > z_threshold))
+        result['outliers'] = [
+            {'product_id': int(pid), 'variance': int(variance[i]), 'z_score': round(float(z_scores[i]), 3)}
+            for pid, i in zip(ids, idx)
+        ]
+
+    # Counters tend to type round figures when they estimate instead of count;
+    # in honest counts roughly 10% / 1% of non-zero quantities end in 0 / 00.
+    counted = jumlah_barang > 0
+    counted_total = int(np.count_nonzero(counted))
+    multiple_of_10 = int(np.count_nonzero(counted & (jumlah_barang % 10 == 0)))
+    multiple_of_100 = int(np.count_nonzero(counted & (jumlah_barang % 100 == 0)))
+    result['round_numbers'] = {
+        'counted_items': counted_total,
+        'multiple_of_10': multiple_of_10,
+        'multiple_of_100': multiple_of_100,
+        'multiple_of_10_ratio': round(multiple_of_10 / counted_total, 4) if counted_total else 0.0,
+        'multiple_of_100_ratio': round(multiple_of_100 / counted_total, 4) if counted_total else 0.0,
+    }
+
+    # There is no unit price on products, so loss is measured in units short
+    loss = -variance
+    ids, idx = _top(product_ids, loss, loss > 0, limit)
+    result['top_losses'] = [
+        {'product_id': int(pid), 'saldo_awal': int(saldo_awal[i]), 'jumlah_barang': int(jumlah_barang[i]),
+         'loss': int(loss[i])}
+        for pid, i in zip(ids, idx)
+    ]
+    return result
@@ -0,0 +1,119 @@
+"""Cold storage for the details of old completed sessions.
+
+Details of completed sessions never change, so once a session is older than
+``ARCHIVE_AFTER_DAYS`` its rows are copied into a per-month SQLite file
+(``details_YYYY_MM.db`` under ``ARCHIVE_DIR``) and deleted from
+``stock_opname_details``. That keeps the table live scans write to, and its
+indexes, proportional to the sessions still in use. The session row itself
+stays in the main database, with a ``session_archives`` row pointing at the
+file, and readers go through ``read_archived_details``.
+"""
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from src.models.stock_opname import db, StockOpnameSession, StockOpnameDetail, SessionArchive
+
+DETAIL_COLUMNS = ('id', 'session_id', 'product_id', 'jumlah_barang', 'catatan', 'created_at', 'updated_at')
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_opname_details (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL,
+    product_id INTEGER NOT NULL,
+    jumlah_barang INTEGER NOT NULL,
+    catatan TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_details_session ON stock_opname_details (session_id);
+"""
+
+
+def archive_file_name(waktu_selesai):
+    return f"details_{waktu_selesai.strftime('%Y_%m')}.db"
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def _parse(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def read_archived_details(archive_dir, archive):
+    """Detail rows of an archived session as tuples in ``DETAIL_COLUMNS`` order.
+
+    Timestamps come back as ``datetime`` like they do from the main database.
+    """
+    path = os.path.join(archive_dir, archive.file)
+    with closing(sqlite3.connect(f'file:{path}?mode=ro', uri=True)) as conn:
+        rows = conn.execute(
+            f"SELECT {', '.join(DETAIL_COLUMNS)} FROM stock_opname_details WHERE session_id = ? ORDER BY id",
+            (archive.session_id,),
+        ).fetchall()
+    return [(*row[:5], _parse(row[5]), _parse(row[6])) for row in rows]
+
+
+def archivable_sessions(older_than):
+    """Completed, not yet archived sessions that finished before ``older_than``."""
+    return db.session.execute(
+        select(StockOpnameSession)
+        .outerjoin(SessionArchive, SessionArchive.session_id == StockOpnameSession.id)
+        .where(
+            StockOpnameSession.status == 'completed',
+            StockOpnameSession.waktu_selesai < older_than,
+            SessionArchive.session_id.is_(None),
+        )
+        .order_by(StockOpnameSession.waktu_selesai)
+    ).scalars().all()
+
+
+def archive_session(archive_dir, session):
+    """Move one session's details into its month's archive file.
+
+    The archive file is written and committed first, then the main database
+    records the archive and deletes the rows in one transaction. If the
+    process dies in between, the rows are still in the hot table and the next
+    run rewrites the session's archive rows from scratch.
+    """
+    columns = [getattr(StockOpnameDetail, name) for name in DETAIL_COLUMNS]
+    rows = db.session.execute(
+        select(*columns).where(StockOpnameDetail.session_id == session.id).order_by(StockOpnameDetail.id)
+    ).all()
+
+    file = archive_file_name(session.waktu_selesai)
+    os.makedirs(archive_dir, exist_ok=True)
+    with closing(sqlite3.connect(os.path.join(archive_dir, file))) as conn:
+        conn.executescript(ARCHIVE_SCHEMA)
+        with conn:
+            conn.execute('DELETE FROM stock_opname_details WHERE session_id = ?', (session.id,))
+            conn.executemany(
+                f"INSERT INTO stock_opname_details ({', '.join(DETAIL_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((*row[:5], _isoformat(row[5]), _isoformat(row[6])) for row in rows),
+            )
+
+    db.session.add(SessionArchive(session_id=session.id, file=file, row_count=len(rows)))
+    db.session.execute(delete(StockOpnameDetail).where(StockOpnameDetail.session_id == session.id))
+    db.session.commit()
+    return file, len(rows)
+
+
+def archive_sessions(archive_dir, older_than_days, dry_run=False):
+    """Archive every completed session older than ``older_than_days``.
+
+    Returns ``[(session, file, row_count), ...]``; with ``dry_run`` nothing is
+    moved and ``row_count`` is ``None``.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = []
+    for session in archivable_sessions(cutoff):
+        if dry_run:
+            archived.append((session, archive_file_name(session.waktu_selesai), None))
+        else:
+            archived.append((session, *archive_session(archive_dir, session)))
+    return archived
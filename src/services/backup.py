@@ -0,0 +1,237 @@
+"""Copies of the SQLite database taken while it is in use.
+
+Backups are written with SQLite's online backup API in small page steps.
+Each step holds a read lock; the database uses a rollback journal (not
+WAL), so a scan that commits during a step waits for that step to end, and
+scans commit between steps. A backup that keeps being restarted by writes
+finishes in one step, which blocks writers for the whole copy. Each backup
+is a plain SQLite file in ``BACKUP_DIR`` that can be opened directly or
+restored with ``restore_backup``. Scheduled backups can be taken by the
+app (``BACKUP_INTERVAL_SECONDS``) or by cron running ``flask backup-db``.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+from sqlalchemy.engine import make_url
+
+try:
+    import fcntl
+except ImportError:  # Windows, development server only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BACKUP_NAME = re.compile(r'^[A-Za-z0-9_-]+-\d{8}-\d{6}\.db$')
+
+
+def sqlite_path(url):
+    """Filesystem path of a ``sqlite:///`` URL, or ``None`` for other databases and in-memory SQLite."""
+    url = make_url(url)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on ``path`` (created if missing) for the block.
+
+    Opened with ``O_CLOEXEC`` so processes started meanwhile (pool workers,
+    subprocesses) never inherit the descriptor and keep the lock held.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_CLOEXEC', 0), 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def copy_database(source, target, pages=1024, sleep=0.0, max_restarts=3):
+    """Copy the SQLite database at ``source`` to ``target`` while it stays in use.
+
+    Uses SQLite's online backup API, ``pages`` pages per step with ``sleep``
+    seconds in between so writers are not locked out for the whole copy. The
+    copy is built next to ``target`` and swapped in with ``os.replace``, so
+    readers of ``target`` see either the old or the new file, never half of one.
+
+    A write to ``source`` from another connection makes SQLite restart the
+    copy. Under steady scan traffic a paced copy could restart forever, so
+    after ``max_restarts`` the rest is copied in a single step, which holds
+    the read lock for the length of one full copy.
+    """
+    temporary = f'{target}.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        last_remaining = remaining
+
+    with closing(sqlite3.connect(source)) as src, closing(sqlite3.connect(temporary)) as dst:
+        try:
+            src.backup(dst, pages=pages, sleep=sleep, progress=progress)
+        except _TooManyRestarts:
+            src.backup(dst)
+    os.replace(temporary, target)
+    return os.path.getsize(target)
+
+
+def backup_path(directory, name):
+    """Path of the backup ``name`` in ``directory``; rejects anything that is not a plain file name."""
+    if not BACKUP_NAME.match(name or ''):
+        raise ValueError(f'Invalid backup name: {name!r}')
+    path = os.path.join(directory, name)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'Backup not found: {name}')
+    return path
+
+
+def create_backup(source, directory, pages=1024, sleep=0.0, prefix='backup'):
+    """Snapshot the database at ``source`` into ``directory``; returns the backup's info."""
+    os.makedirs(directory, exist_ok=True)
+    name = f"{prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db"
+    started = time.perf_counter()
+    copy_database(source, os.path.join(directory, name), pages=pages, sleep=sleep)
+    info = backup_info(directory, name)
+    info['seconds'] = round(time.perf_counter() - started, 3)
+    return info
+
+
+def backup_info(directory, name):
+    stat = os.stat(os.path.join(directory, name))
+    return {
+        'name': name,
+        'size': stat.st_size,
+        'created_at': datetime.fromtimestamp(stat.st_mtime).isoformat(timespec='seconds'),
+    }
+
+
+def list_backups(directory):
+    """Backups in ``directory``, newest first."""
+    if not os.path.isdir(directory):
+        return []
+    backups = [backup_info(directory, name) for name in os.listdir(directory) if BACKUP_NAME.match(name)]
+    backups.sort(key=lambda backup: (backup['created_at'], backup['name']), reverse=True)
+    return backups
+
+
+def prune_backups(directory, keep):
+    """Delete all but the ``keep`` newest backups; returns the deleted names."""
+    pruned = [backup['name'] for backup in list_backups(directory)[keep:]]
+    for name in pruned:
+        os.remove(os.path.join(directory, name))
+    return pruned
+
+
+def restore_backup(directory, name, target, pages=1024, sleep=0.0):
+    """Replace the live database at ``target`` with the backup ``name``.
+
+    The current contents are snapshotted first (``pre-restore-*.db``). The
+    backup is then copied into the live database in a single step through
+    SQLite, so other connections see the old database or the restored one,
+    never a mix, and nothing needs to be restarted. Returns the info of the
+    pre-restore snapshot.
+    """
+    path = backup_path(directory, name)
+    safety = create_backup(target, directory, pages=pages, sleep=sleep, prefix='pre-restore')
+    with closing(sqlite3.connect(path)) as src, closing(sqlite3.connect(target, timeout=30)) as dst:
+        src.backup(dst)
+    return safety
+
+
+class BackupScheduler(threading.Thread):
+    """Take a backup every ``interval`` seconds and keep the newest ``keep``.
+
+    Every worker starts one, but only the one holding the scheduler lock
+    takes backups, for as long as its process lives; the others retry every
+    interval in case that worker exits. A round that finds a backup younger
+    than the interval (e.g. one taken through the API) is skipped.
+    """
+
+    def __init__(self, app, interval, keep):
+        super().__init__(daemon=True, name='backup-scheduler')
+        self.app = app
+        self.interval = interval
+        self.keep = keep
+        self.pid = os.getpid()
+
+    def _due(self, directory):
+        backups = [backup for backup in list_backups(directory) if backup['name'].startswith('backup-')]
+        if not backups:
+            return True
+        newest = os.path.getmtime(os.path.join(directory, backups[0]['name']))
+        return newest < time.time() - self.interval * 0.9
+
+    def _become_scheduler(self, directory):
+        """Block until this process holds the scheduler lock; it is released when the process exits."""
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(os.path.join(directory, '.scheduler.lock'), os.O_RDWR | os.O_CREAT | getattr(os, 'O_CLOEXEC', 0), 0o644)
+        if fcntl is None:
+            return
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                time.sleep(self.interval)
+
+    def run(self):
+        config = self.app.config
+        source = sqlite_path(config['SQLALCHEMY_DATABASE_URI'])
+        directory = config['BACKUP_DIR']
+        self._become_scheduler(directory)
+        while True:
+            try:
+                if self._due(directory):
+                    backup = create_backup(source, directory, config['BACKUP_STEP_PAGES'], config['BACKUP_STEP_SLEEP'])
+                    logger.info('Backup %s written (%d bytes)', backup['name'], backup['size'])
+                    prune_backups(directory, self.keep)
+            except Exception:
+                logger.exception('Scheduled backup failed')
+            time.sleep(self.interval)
+
+
+_lock = threading.Lock()
+
+
+def backup_scheduler(app):
+    """The current worker's scheduler, started on its first request.
+
+    Never started in gunicorn's preloading master: its scheduler lock would
+    be inherited by every forked worker and never released.
+    """
+    scheduler = app.extensions.get('backup_scheduler')
+    if scheduler is None or scheduler.pid != os.getpid():
+        with _lock:
+            scheduler = app.extensions.get('backup_scheduler')
+            if scheduler is None or scheduler.pid != os.getpid():
+                scheduler = BackupScheduler(app, app.config['BACKUP_INTERVAL_SECONDS'], app.config['BACKUP_KEEP'])
+                scheduler.start()
+                app.extensions['backup_scheduler'] = scheduler
+    return scheduler
+
+
+def init_backups(app):
+    if app.config['BACKUP_INTERVAL_SECONDS'] > 0 and sqlite_path(app.config['SQLALCHEMY_DATABASE_URI']):
+        @app.before_request
+        def ensure_backup_scheduler():
+            backup_scheduler(app)
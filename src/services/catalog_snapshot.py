@@ -0,0 +1,188 @@
+"""Read-only binary snapshot of the product catalog, shared by all workers.
+
+The snapshot is one file, sorted by ``kode_produk`` (compared as UTF-8
+bytes)::
+
+    header   magic, product count, code blob size, name blob size, highest id
+    ids      int64[count]
+    saldo    int64[count]           saldo_awal
+    created  int64[count]           created_at, microseconds since 1970 (NO_DATE if unset)
+    codes    uint32[count + 1]      offsets into the code blob
+    names    uint32[count + 1]      offsets into the name blob
+    code blob, name blob            UTF-8
+
+Workers ``mmap`` it, so the pages are shared through the page cache rather
+than copied into every process, and code lookups and prefix searches are a
+binary search over the offset array. It is rebuilt after imports into a
+temporary file and swapped in with ``os.replace``; readers notice the new
+inode on their next lookup and map it, while lookups already running finish
+on the old mapping. Rebuilds are serialized by a lock file, so a rebuild
+that read the catalog earlier never replaces a later one.
+
+Products created one by one are not in the snapshot until the next
+rebuild. Code lookups fall back to the database when a code is not found,
+and prefix searches add the matching products whose id is above the
+snapshot's highest id (a rowid range, so only the new products are read).
+A snapshot in an older format is ignored (callers use the database) until
+it is rebuilt.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from src.models.stock_opname import db, Product
+from src.services.backup import file_lock
+
+MAGIC = b'SOCAT003'
+HEADER = struct.Struct('<8sIIIq')
+EPOCH = datetime(1970, 1, 1)
+NO_DATE = -(1 << 63)
+
+
+def _microseconds(value):
+    return NO_DATE if value is None else (value - EPOCH) // timedelta(microseconds=1)
+
+
+def build_snapshot(path):
+    """Write a snapshot of the ``products`` table to ``path``; returns the product count."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with file_lock(path + '.lock'):
+        # Read inside the lock: a rebuild that starts later sees later commits
+        rows = db.session.execute(
+            select(Product.kode_produk, Product.id, Product.saldo_awal, Product.nama_produk, Product.created_at)
+        ).all()
+        rows = sorted(
+            (kode.encode(), id, saldo_awal, nama.encode(), _microseconds(created_at))
+            for kode, id, saldo_awal, nama, created_at in rows
+        )
+
+        count = len(rows)
+        code_offsets = [0]
+        name_offsets = [0]
+        for kode, _, _, nama, _ in rows:
+            code_offsets.append(code_offsets[-1] + len(kode))
+            name_offsets.append(name_offsets[-1] + len(nama))
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.catalog_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, count, code_offsets[-1], name_offsets[-1], max((row[1] for row in rows), default=0)))
+                f.write(struct.pack(f'<{count}q', *(row[1] for row in rows)))
+                f.write(struct.pack(f'<{count}q', *(row[2] for row in rows)))
+                f.write(struct.pack(f'<{count}q', *(row[4] for row in rows)))
+                f.write(struct.pack(f'<{count + 1}I', *code_offsets))
+                f.write(struct.pack(f'<{count + 1}I', *name_offsets))
+                f.write(b''.join(row[0] for row in rows))
+                f.write(b''.join(row[3] for row in rows))
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return count
+
+
+class CatalogSnapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, code_size, _, self.max_id = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a catalog snapshot')
+
+        count = self.count
+        view = memoryview(self._map)
+        position = HEADER.size
+        self._ids = view[position:position + 8 * count].cast('q')
+        position += 8 * count
+        self._saldo = view[position:position + 8 * count].cast('q')
+        position += 8 * count
+        self._created = view[position:position + 8 * count].cast('q')
+        position += 8 * count
+        self._code_offsets = view[position:position + 4 * (count + 1)].cast('I')
+        position += 4 * (count + 1)
+        self._name_offsets = view[position:position + 4 * (count + 1)].cast('I')
+        position += 4 * (count + 1)
+        self._codes = position
+        self._names = position + code_size
+
+    def __len__(self):
+        return self.count
+
+    def _code(self, i):
+        return self._map[self._codes + self._code_offsets[i]:self._codes + self._code_offsets[i + 1]]
+
+    def _lower_bound(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._code(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _product(self, i):
+        """The product at ``i``, with the same keys as ``Product.to_dict()``."""
+        name = self._map[self._names + self._name_offsets[i]:self._names + self._name_offsets[i + 1]]
+        created = self._created[i]
+        return {
+            'id': self._ids[i],
+            'kode_produk': self._code(i).decode(),
+            'nama_produk': name.decode(),
+            'saldo_awal': self._saldo[i],
+            'created_at': None if created == NO_DATE else (EPOCH + timedelta(microseconds=created)).isoformat(),
+        }
+
+    def get(self, kode_produk):
+        key = kode_produk.encode()
+        i = self._lower_bound(key)
+        if i < self.count and self._code(i) == key:
+            return self._product(i)
+        return None
+
+    def prefix(self, prefix, limit=10):
+        """Products whose code starts with ``prefix``, in code order."""
+        key = prefix.encode()
+        products = []
+        i = self._lower_bound(key)
+        while i < self.count and len(products) < limit and self._code(i).startswith(key):
+            products.append(self._product(i))
+            i += 1
+        return products
+
+
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def load_snapshot(path):
+    """The snapshot at ``path``, re-mapped whenever the file has been replaced.
+
+    Returns ``None`` if no snapshot has been built yet, or only one in an
+    older format.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    snapshot = _snapshots.get(path)
+    if snapshot is None or (snapshot.stat.st_ino, snapshot.stat.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+        with _lock:
+            snapshot = _snapshots.get(path)
+            if snapshot is None or (snapshot.stat.st_ino, snapshot.stat.st_mtime_ns) != (stat.st_ino, stat.st_mtime_ns):
+                try:
+                    snapshot = CatalogSnapshot(path)
+                except ValueError:
+                    return None
+                _snapshots[path] = snapshot
+    return snapshot
@@ -0,0 +1,63 @@
+"""Bulk import of counted quantities into a session.
+
+Handheld scanners export ``kode, qty`` files; instead of one
+``add_session_detail`` per line, the codes are resolved with one bulk lookup
+and all details are upserted in a single statement.
+"""
+from datetime import datetime
+
+from sqlalchemy import select
+
+from src.models.stock_opname import db, StockOpnameDetail
+from src.services.details import detail_upsert
+from src.services.product_import import existing_products
+
+COUNT_MODES = ('overwrite', 'add')
+# Unknown codes listed in the response; the count is always reported
+UNKNOWN_CODES_LIMIT = 1000
+
+
+def import_counts(session_id, counts, mode='overwrite'):
+    """Upsert ``counts`` (``kode_produk``, ``jumlah_barang``) into a session.
+
+    Lines repeating a code are summed first, as they are the same product
+    counted in several places. ``overwrite`` replaces the quantity of
+    products already in the session, ``add`` adds to it; notes are kept
+    either way. The caller commits.
+    """
+    totals = counts.groupby('kode_produk', sort=False)['jumlah_barang'].sum()
+    codes = totals.index.tolist()
+    found = existing_products(codes)
+
+    connection = db.session.connection()
+    already_counted = set(connection.execute(
+        select(StockOpnameDetail.product_id).where(StockOpnameDetail.session_id == session_id)
+    ).scalars())
+
+    now = datetime.utcnow()
+    details = []
+    unknown = []
+    for kode_produk, jumlah_barang in zip(codes, totals.tolist()):
+        product = found.get(kode_produk)
+        if product is None:
+            unknown.append(kode_produk)
+            continue
+        details.append({
+            'session_id': session_id,
+            'product_id': product[0],
+            'jumlah_barang': jumlah_barang,
+            'catatan': None,
+            'created_at': now,
+            'updated_at': now,
+        })
+
+    if details:
+        connection.execute(detail_upsert(connection, add=mode == 'add'), details)
+    updated = sum(1 for detail in details if detail['product_id'] in already_counted)
+    return {
+        'inserted': len(details) - updated,
+        'updated': updated,
+        'duplicate_lines': len(counts) - len(totals),
+        'unknown_count': len(unknown),
+        'unknown_codes': unknown[:UNKNOWN_CODES_LIMIT],
+    }
@@ -0,0 +1,49 @@
+"""Version of the data that cached reports and exports are built from.
+
+Aggregates of completed sessions are cached in each worker's memory and
+embed product names and ``saldo_awal``, so a product import, a session
+delete or purge and a backup restore all change what they would contain.
+Clearing the cache only helps the worker that made the change; instead
+each change stores a new random version in the database (in the change's
+own transaction where it can), and every worker puts the version it reads
+into its cache keys. Entries built from older data are then never hit
+again and age out of the LRU cache.
+
+The version is read through ``db.session``, so a ``@read_replica`` view
+reads it from the replica together with the data it caches. Read it
+before the data: a result cached under an older version is never served.
+"""
+import uuid
+
+from sqlalchemy import insert, select, update
+
+from src.models.stock_opname import db, DataVersion
+
+CATALOG = 'catalog'
+
+
+def data_version():
+    """The current version; ``''`` until the first change."""
+    return db.session.execute(
+        select(DataVersion.version).where(DataVersion.name == CATALOG)
+    ).scalar() or ''
+
+
+def bump_data_version():
+    """Store a new version in ``db.session``; the caller commits."""
+    version = uuid.uuid4().hex
+    # A backup taken before this table existed restores a database without it
+    DataVersion.__table__.create(db.session.connection(), checkfirst=True)
+    updated = db.session.execute(
+        update(DataVersion).where(DataVersion.name == CATALOG).values(version=version)
+    ).rowcount
+    if not updated:
+        db.session.execute(insert(DataVersion).values(name=CATALOG, version=version))
+    return version
+
+
+def publish_data_version():
+    """Store and commit a new version, after a change committed on its own."""
+    version = bump_data_version()
+    db.session.commit()
+    return version
@@ -0,0 +1,188 @@
+"""Reading a session's details, wherever they are stored.
+
+Routes and exports go through ``session_detail_rows`` instead of
+``StockOpnameDetail.query`` so that archived sessions (see
+``src/services/archive.py``) read the same as live ones, and so a session's
+details and their products come back from one joined query instead of one
+product query per detail.
+"""
+from collections import defaultdict, namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select, tuple_
+
+from src.models.stock_opname import db, Product, StockOpnameDetail, SessionArchive
+from src.services.archive import read_archived_details
+from src.services.product_import import LOOKUP_CHUNK
+from src.services.queries import upsert_insert
+from src.services.session_book import BOOK_SALDO_AWAL, join_book, session_book
+
+DetailRow = namedtuple('DetailRow', [
+    'id', 'session_id', 'product_id', 'jumlah_barang', 'catatan', 'created_at', 'updated_at',
+    'kode_produk', 'nama_produk', 'saldo_awal', 'product_created_at',
+])
+
+PRODUCT_COLUMNS = (Product.kode_produk, Product.nama_produk, Product.saldo_awal, Product.created_at)
+
+DETAIL_COLUMNS = (
+    StockOpnameDetail.id, StockOpnameDetail.session_id, StockOpnameDetail.product_id,
+    StockOpnameDetail.jumlah_barang, StockOpnameDetail.catatan,
+    StockOpnameDetail.created_at, StockOpnameDetail.updated_at,
+)
+
+
+def _products_by_id(product_ids):
+    found = {}
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), LOOKUP_CHUNK):
+        chunk = product_ids[start:start + LOOKUP_CHUNK]
+        for product_id, *product in db.session.execute(
+            select(Product.id, *PRODUCT_COLUMNS).where(Product.id.in_(chunk))
+        ):
+            found[product_id] = tuple(product)
+    return found
+
+
+def session_archive(session_id):
+    return db.session.get(SessionArchive, session_id)
+
+
+def session_item_counts(session_ids):
+    """``{session_id: (total_items, archived)}`` for a page of sessions.
+
+    One grouped count and one archive lookup per chunk of ids, instead of
+    loading every session's details to count them. Archived sessions report
+    the row count recorded when they were archived.
+    """
+    counts = dict.fromkeys(session_ids, (0, False))
+    session_ids = sorted(counts)
+    for start in range(0, len(session_ids), LOOKUP_CHUNK):
+        chunk = session_ids[start:start + LOOKUP_CHUNK]
+        for session_id, count in db.session.execute(
+            select(StockOpnameDetail.session_id, func.count())
+            .where(StockOpnameDetail.session_id.in_(chunk))
+            .group_by(StockOpnameDetail.session_id)
+        ):
+            counts[session_id] = (count, False)
+        for session_id, row_count in db.session.execute(
+            select(SessionArchive.session_id, SessionArchive.row_count).where(SessionArchive.session_id.in_(chunk))
+        ):
+            counts[session_id] = (row_count, True)
+    return counts
+
+
+def session_detail_rows(session_id):
+    """All details of a session as ``DetailRow`` tuples, ordered by detail id.
+
+    ``saldo_awal`` is the session's book quantity (see
+    ``src/services/session_book.py``).
+    """
+    archive = session_archive(session_id)
+    if archive is not None:
+        rows = read_archived_details(current_app.config['ARCHIVE_DIR'], archive)
+        products = _products_by_id({row[2] for row in rows})
+        for product_id, saldo_awal in session_book(session_id).items():
+            if product_id in products:
+                kode_produk, nama_produk, _, created_at = products[product_id]
+                products[product_id] = (kode_produk, nama_produk, saldo_awal, created_at)
+        missing = (None, None, None, None)
+        return [DetailRow(*row, *products.get(row[2], missing)) for row in rows]
+
+    rows = db.session.execute(
+        join_book(
+            select(*DETAIL_COLUMNS, Product.kode_produk, Product.nama_produk, BOOK_SALDO_AWAL, Product.created_at)
+            .outerjoin(Product, Product.id == StockOpnameDetail.product_id)
+        )
+        .where(StockOpnameDetail.session_id == session_id)
+        .order_by(StockOpnameDetail.id)
+    )
+    return [DetailRow(*row) for row in rows]
+
+
+def detail_upsert(connection, add=False):
+    """INSERT of detail rows that updates the existing row of the same
+    session and product instead. With ``add`` the quantity is added to the
+    existing one; otherwise it replaces it. A ``catatan`` of ``None`` keeps
+    the existing note.
+    """
+    table = StockOpnameDetail.__table__
+    statement = upsert_insert(connection, table)
+    excluded = statement.excluded
+    jumlah_barang = table.c.jumlah_barang + excluded.jumlah_barang if add else excluded.jumlah_barang
+    return statement.on_conflict_do_update(
+        index_elements=['session_id', 'product_id'],
+        set_={
+            'jumlah_barang': jumlah_barang,
+            'catatan': func.coalesce(excluded.catatan, table.c.catatan),
+            'updated_at': excluded.updated_at,
+        },
+    )
+
+
+def upsert_details(connection, details):
+    """Record many scans in the caller's transaction.
+
+    ``details`` are dicts with ``session_id``, ``product_id``, ``jumlah_barang``
+    and ``catatan``, applied in order like repeated ``add_session_detail``
+    calls: a later scan of the same product in the same session overwrites the
+    earlier one. Returns the resulting detail columns (``DetailRow`` without
+    the product) keyed by ``(session_id, product_id)``.
+    """
+    now = datetime.utcnow()
+    connection.execute(
+        detail_upsert(connection),
+        [{**detail, 'created_at': now, 'updated_at': now} for detail in details],
+    )
+
+    keys = sorted({(detail['session_id'], detail['product_id']) for detail in details})
+    found = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[start:start + LOOKUP_CHUNK]
+        for row in connection.execute(
+            select(*DETAIL_COLUMNS).where(
+                tuple_(StockOpnameDetail.session_id, StockOpnameDetail.product_id).in_(chunk)
+            )
+        ):
+            found[row.session_id, row.product_id] = tuple(row)
+    return found
+
+
+def detail_dict(row):
+    """``StockOpnameDetail.to_dict()`` for a ``DetailRow``."""
+    return {
+        'id': row.id,
+        'session_id': row.session_id,
+        'product_id': row.product_id,
+        'product': {
+            'id': row.product_id,
+            'kode_produk': row.kode_produk,
+            'nama_produk': row.nama_produk,
+            'saldo_awal': row.saldo_awal,
+            'created_at': row.product_created_at.isoformat() if row.product_created_at else None
+        } if row.kode_produk is not None else None,
+        'jumlah_barang': row.jumlah_barang,
+        'catatan': row.catatan,
+        'created_at': row.created_at.isoformat() if row.created_at else None,
+        'updated_at': row.updated_at.isoformat() if row.updated_at else None
+    }
+
+
+def archived_aggregate_rows(archives, lokasi_by_session):
+    """Archived counts summed per product and lokasi, shaped and sorted like
+    the rows of the aggregate report query (by ``kode_produk``, then ``lokasi``).
+    """
+    totals = defaultdict(int)
+    for archive in archives:
+        lokasi = lokasi_by_session[archive.session_id]
+        for row in read_archived_details(current_app.config['ARCHIVE_DIR'], archive):
+            totals[row[2], lokasi] += row[3]
+
+    products = _products_by_id({product_id for product_id, _ in totals})
+    rows = [
+        (product_id, *products[product_id][:3], lokasi, jumlah_barang)
+        for (product_id, lokasi), jumlah_barang in totals.items()
+        if product_id in products
+    ]
+    rows.sort(key=lambda row: (row[1], row[4]))
+    return rows
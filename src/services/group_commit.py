@@ -0,0 +1,167 @@
+"""Group commit for scan writes.
+
+Every ``add_session_detail`` normally commits on its own, and on SQLite each
+commit waits for an fsync, so scan throughput is bounded by the disk's sync
+rate rather than by the work itself. With ``GROUP_COMMIT_ENABLED`` the
+validated scan is handed to one writer thread per worker process instead.
+The writer collects whatever arrives within ``GROUP_COMMIT_MAX_DELAY_MS`` of
+the first waiting scan (or until ``GROUP_COMMIT_MAX_BATCH`` are waiting),
+upserts them in a single transaction and commits once. Each request blocks
+until the commit that contains its scan has returned, so a scan is never
+acknowledged before it is durable.
+
+If a batch fails, its scans are retried one transaction each, so a single
+bad scan only fails its own request. With sharding, a batch is split by
+shard and each shard's scans are committed together. Any other error fails
+the scans of its batch rather than the writer, and a writer thread that has
+died anyway is replaced on the next submit, taking over its queue.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from src.services.details import upsert_details
+from src.services.sharding import shard_engine
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitWriter(threading.Thread):
+    def __init__(self, app, max_delay, max_batch, pending=None):
+        super().__init__(daemon=True, name='group-commit')
+        self.app = app
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.pid = os.getpid()
+        self.batches = 0
+        self.items = 0
+        self.commit_seconds = 0.0
+        self._queue = pending if pending is not None else queue.SimpleQueue()
+
+    def submit(self, detail, shard=None):
+        """Queue one scan; the future resolves to its detail columns once committed."""
+        future = Future()
+        self._queue.put((shard, detail, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, shard, batch):
+        with shard_engine(shard).begin() as connection:
+            return upsert_details(connection, [detail for _, detail, _ in batch])
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._collect()
+                try:
+                    self._commit(batch)
+                except BaseException as e:
+                    # Never leave a request waiting on a scan the writer gave up on
+                    logger.exception('Group commit of %d scans failed', len(batch))
+                    for _, _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    if not isinstance(e, Exception):
+                        raise
+
+    def _commit(self, batch):
+        by_shard = {}
+        for item in batch:
+            by_shard.setdefault(item[0], []).append(item)
+        started = time.perf_counter()
+        for shard, items in by_shard.items():
+            try:
+                rows = self._write(shard, items)
+            except Exception:
+                logger.exception('Group commit of %d scans failed, retrying one by one', len(items))
+                self._write_each(shard, items)
+            else:
+                for _, detail, future in items:
+                    future.set_result(rows[detail['session_id'], detail['product_id']])
+            self.batches += 1
+        self.items += len(batch)
+        self.commit_seconds += time.perf_counter() - started
+
+    def _write_each(self, shard, batch):
+        for item in batch:
+            _, detail, future = item
+            try:
+                rows = self._write(shard, [item])
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(rows[detail['session_id'], detail['product_id']])
+
+    def collect(self):
+        """Exposition lines for ``/metrics``."""
+        return [
+            '# HELP group_commit_batches_total Transactions committed by the scan writer.',
+            '# TYPE group_commit_batches_total counter',
+            f'group_commit_batches_total {self.batches}',
+            '# HELP group_commit_items_total Scans written by the scan writer.',
+            '# TYPE group_commit_items_total counter',
+            f'group_commit_items_total {self.items}',
+            '# HELP group_commit_seconds_total Time spent writing and committing batches.',
+            '# TYPE group_commit_seconds_total counter',
+            f'group_commit_seconds_total {self.commit_seconds:.6f}',
+            '# HELP group_commit_queued Scans waiting for the next batch.',
+            '# TYPE group_commit_queued gauge',
+            f'group_commit_queued {self._queue.qsize()}',
+        ]
+
+
+_lock = threading.Lock()
+
+
+def group_commit_writer():
+    """The current worker's writer, started on first use.
+
+    Started lazily because gunicorn preloads the app and forks afterwards:
+    a thread started in the master would not exist in the workers. A writer
+    whose thread has died is replaced, and its queued scans are handed over.
+    """
+    app = current_app._get_current_object()
+    writer = app.extensions.get('group_commit')
+    if writer is None or writer.pid != os.getpid() or not writer.is_alive():
+        with _lock:
+            writer = app.extensions.get('group_commit')
+            if writer is None or writer.pid != os.getpid() or not writer.is_alive():
+                if writer is not None and writer.pid == os.getpid():
+                    logger.error('Group commit writer died, starting a new one')
+                writer = GroupCommitWriter(
+                    app,
+                    app.config['GROUP_COMMIT_MAX_DELAY_MS'] / 1000,
+                    app.config['GROUP_COMMIT_MAX_BATCH'],
+                    pending=writer._queue if writer is not None and writer.pid == os.getpid() else None,
+                )
+                writer.start()
+                app.extensions['group_commit'] = writer
+    return writer
+
+
+def init_group_commit(app):
+    if app.config['METRICS_ENABLED']:
+        from src.services.metrics import registry
+
+        def collect():
+            writer = app.extensions.get('group_commit')
+            return writer.collect() if writer is not None and writer.pid == os.getpid() else []
+
+        registry.register_collector(collect)
@@ -0,0 +1,139 @@
+"""Dry-run product imports.
+
+A preview compares the parsed file with the catalog in one pass and stores
+the parsed products under a token, so the manager can page through the diff
+and then apply exactly what was reviewed without uploading the file again.
+
+Previews are pickled to disk rather than kept in memory because the
+follow-up requests may land on another gunicorn worker. They are only ever
+read back by token from a directory the application owns.
+"""
+import os
+import pickle
+import re
+import secrets
+import time
+
+import pandas as pd
+from sqlalchemy import select
+
+from src.models.stock_opname import db, Product
+
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+DIFF_COLUMNS = ['status', 'kode_produk', 'nama_lama', 'nama_baru', 'saldo_lama', 'saldo_baru',
+                'name_changed', 'saldo_changed', 'row']
+# Order of the statuses in the diff; unchanged rows are counted but not listed
+STATUSES = ['new', 'changed', 'missing']
+
+
+def diff_products(products):
+    """Compare parsed products with the catalog.
+
+    ``products`` has unique ``kode_produk`` values (see ``merge_products``).
+    The catalog is read once and matched with a single outer merge. Returns
+    ``(diff, summary)``: ``diff`` lists new, changed and missing SKUs,
+    sorted by status then code; ``summary`` holds the counts.
+    """
+    columns = Product.__table__.c
+    current = pd.DataFrame(
+        db.session.connection().execute(
+            select(columns.kode_produk, columns.nama_produk, columns.saldo_awal)
+        ).all(),
+        columns=['kode_produk', 'nama_lama', 'saldo_lama'],
+    )
+    incoming = products[['kode_produk', 'nama_produk', 'saldo_awal', 'row']].rename(
+        columns={'nama_produk': 'nama_baru', 'saldo_awal': 'saldo_baru'})
+
+    merged = incoming.merge(current, on='kode_produk', how='outer', indicator=True)
+    both = (merged['_merge'] == 'both').to_numpy()
+    name_changed = both & (merged['nama_lama'] != merged['nama_baru']).to_numpy()
+    saldo_changed = both & (merged['saldo_lama'] != merged['saldo_baru']).to_numpy()
+
+    status = pd.Series('unchanged', index=merged.index)
+    status[(merged['_merge'] == 'left_only').to_numpy()] = 'new'
+    status[(merged['_merge'] == 'right_only').to_numpy()] = 'missing'
+    status[name_changed | saldo_changed] = 'changed'
+    merged['status'] = pd.Categorical(status, categories=[*STATUSES, 'unchanged'], ordered=True)
+    merged['name_changed'] = name_changed
+    merged['saldo_changed'] = saldo_changed
+    for column in ('saldo_lama', 'saldo_baru', 'row'):
+        merged[column] = merged[column].astype('Int64')
+
+    counts = merged['status'].value_counts()
+    summary = {name: int(counts.get(name, 0)) for name in [*STATUSES, 'unchanged']}
+    summary['name_changed'] = int(name_changed.sum())
+    summary['saldo_changed'] = int(saldo_changed.sum())
+
+    diff = (merged[merged['status'] != 'unchanged']
+            .sort_values(['status', 'kode_produk'], kind='stable')
+            .reset_index(drop=True)[DIFF_COLUMNS])
+    return diff, summary
+
+
+def diff_page(diff, page=1, per_page=100, status=None):
+    """One page of the diff as JSON-ready dicts, optionally for one status."""
+    if status:
+        diff = diff[diff['status'] == status]
+    start = (page - 1) * per_page
+    rows = diff.iloc[start:start + per_page]
+    records = rows.astype(object).where(rows.notna(), None).to_dict('records')
+    for record in records:
+        record['status'] = str(record['status'])
+    return {
+        'data': records,
+        'total': len(diff),
+        'page': page,
+        'per_page': per_page,
+        'pages': (len(diff) + per_page - 1) // per_page,
+    }
+
+
+class PreviewStore:
+    """Previews pickled under ``directory``, dropped after ``ttl`` seconds."""
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, token):
+        return os.path.join(self.directory, f'{token}.pickle')
+
+    def save(self, preview):
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        token = secrets.token_urlsafe(18)
+        temporary = self._path(token) + '.tmp'
+        with open(temporary, 'wb') as f:
+            pickle.dump(preview, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self._path(token))
+        return token
+
+    def load(self, token):
+        if not TOKEN_PATTERN.match(token or ''):
+            return None
+        path = self._path(token)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def discard(self, token):
+        if TOKEN_PATTERN.match(token or ''):
+            try:
+                os.remove(self._path(token))
+            except FileNotFoundError:
+                pass
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,424 @@
+import atexit
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import fcntl
+except ImportError:  # Windows, development server only
+    fcntl = None
+
+slow_query_logger = logging.getLogger('src.slow_query')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+# Statistics of the request being served by the current thread, or None
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('started', 'sql_statements', 'sql_seconds', 'rows_fetched', 'bytes_sent')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows_fetched = 0
+        self.bytes_sent = 0
+
+
+class MetricsRegistry:
+    """Per-process request metrics rendered in the Prometheus text format.
+
+    Each gunicorn worker keeps its own registry; with ``METRICS_DIR`` set,
+    ``SharedMetrics`` merges the registries of every worker for ``/metrics``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = defaultdict(float)
+        self.duration_count = defaultdict(int)
+        self.sql_statements = defaultdict(int)
+        self.sql_seconds = defaultdict(float)
+        self.rows_fetched = defaultdict(int)
+        self.bytes_sent = defaultdict(int)
+        self.slow_queries = 0
+        self._collectors = []
+
+    def register_collector(self, collector):
+        """Add a callable returning extra exposition lines for ``/metrics``."""
+        self._collectors.append(collector)
+
+    def observe(self, method, endpoint, status, stats):
+        key = (method, endpoint)
+        elapsed = time.perf_counter() - stats.started
+        with self._lock:
+            self.requests[(method, endpoint, status)] += 1
+            buckets = self.duration_buckets[key]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if elapsed <= bound:
+                    buckets[i] += 1
+            self.duration_sum[key] += elapsed
+            self.duration_count[key] += 1
+            self.sql_statements[key] += stats.sql_statements
+            self.sql_seconds[key] += stats.sql_seconds
+            self.rows_fetched[key] += stats.rows_fetched
+            self.bytes_sent[key] += stats.bytes_sent
+
+    def render(self):
+        lines = []
+
+        def labels(method, endpoint, **extra):
+            items = {'method': method, 'endpoint': endpoint, **extra}
+            return '{' + ','.join(f'{k}="{v}"' for k, v in items.items()) + '}'
+
+        with self._lock:
+            lines += ['# HELP http_requests_total Requests served.', '# TYPE http_requests_total counter']
+            for (method, endpoint, status), value in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{labels(method, endpoint, status=status)} {value}')
+
+            lines += ['# HELP http_request_duration_seconds Wall time per request.',
+                      '# TYPE http_request_duration_seconds histogram']
+            for (method, endpoint), buckets in sorted(self.duration_buckets.items()):
+                for bound, value in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'http_request_duration_seconds_bucket{labels(method, endpoint, le=bound)} {value}')
+                count = self.duration_count[(method, endpoint)]
+                lines.append(f'http_request_duration_seconds_bucket{labels(method, endpoint, le="+Inf")} {count}')
+                lines.append(f'http_request_duration_seconds_sum{labels(method, endpoint)} '
+                             f'{self.duration_sum[(method, endpoint)]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{labels(method, endpoint)} {count}')
+
+            for name, help_text, values in (
+                ('http_request_sql_statements_total', 'SQL statements executed.', self.sql_statements),
+                ('http_request_sql_seconds_total', 'Time spent executing SQL.', self.sql_seconds),
+                ('http_request_rows_fetched_total', 'Rows fetched from database cursors.', self.rows_fetched),
+                ('http_response_bytes_total', 'Response body bytes sent.', self.bytes_sent),
+            ):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for (method, endpoint), value in sorted(values.items()):
+                    lines.append(f'{name}{labels(method, endpoint)} {value:.6f}' if isinstance(value, float)
+                                 else f'{name}{labels(method, endpoint)} {value}')
+
+            lines += ['# HELP slow_queries_total Statements slower than the slow-query threshold.',
+                      '# TYPE slow_queries_total counter', f'slow_queries_total {self.slow_queries}']
+
+        for collector in self._collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+# Families kept from workers that have exited: their totals must not vanish
+CUMULATIVE_TYPES = ('counter', 'histogram')
+
+
+def merge_expositions(texts, cumulative_only=False):
+    """Sum the samples of several Prometheus text expositions series by series.
+
+    Counters and histograms add up across workers, and so do gauges (slots,
+    queued requests). With ``cumulative_only`` gauges are dropped.
+    """
+    meta = {}
+    types = {}
+    families = {}
+    for text in texts:
+        for line in text.splitlines():
+            if line.startswith('# '):
+                parts = line.split(' ', 3)
+                if len(parts) == 4:
+                    meta.setdefault(parts[2], {})[parts[1]] = line
+                    if parts[1] == 'TYPE':
+                        types[parts[2]] = parts[3]
+                continue
+            if not line.strip():
+                continue
+            series, _, value = line.rpartition(' ')
+            name = series.split('{', 1)[0]
+            family = name
+            for suffix in HISTOGRAM_SUFFIXES:
+                if name.endswith(suffix) and types.get(name[:-len(suffix)]) == 'histogram':
+                    family = name[:-len(suffix)]
+            samples = families.setdefault(family, {})
+            samples[series] = samples.get(series, 0.0) + float(value)
+
+    lines = []
+    for family, samples in families.items():
+        if cumulative_only and types.get(family) not in CUMULATIVE_TYPES:
+            continue
+        lines += [meta[family][kind] for kind in ('HELP', 'TYPE') if kind in meta.get(family, {})]
+        lines += [f'{series} {int(value) if value.is_integer() else f"{value:.6f}"}'
+                  for series, value in samples.items()]
+    return '\n'.join(lines) + '\n'
+
+
+def _alive(pid):
+    if fcntl is None:
+        # The single-process development server; os.kill would terminate pid
+        return pid == os.getpid()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedMetrics:
+    """Per-worker metrics merged through a directory of per-process files.
+
+    Every worker writes its own exposition to ``<pid>-<start>.prom`` (at
+    most every ``flush_seconds``, when serving ``/metrics`` and at exit), so
+    a scrape answered by any worker sees the sum over all of them and the
+    ``_total`` series only ever grow. Files of workers that have exited,
+    e.g. recycled by ``max_requests``, are folded into ``exited.prom``,
+    keeping only their counters and histograms.
+    """
+
+    EXITED = 'exited.prom'
+
+    def __init__(self, directory, flush_seconds=1.0):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pid = None
+        self._path = None
+        self._flushed = 0.0
+        self._timer = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _own_path(self):
+        # A forked worker is a new process and gets a file of its own
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._path = os.path.join(self.directory, f'{pid}-{time.time_ns()}.prom')
+            self._flushed = 0.0
+            self._timer = None
+        return self._path
+
+    def flush(self, force=False):
+        with self._lock:
+            path = self._own_path()
+            now = time.monotonic()
+            if not force and now - self._flushed < self.flush_seconds:
+                # Write the trailing updates once the interval is over
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_seconds - (now - self._flushed), self._flush_later)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._flushed = now
+        _write_atomic(path, registry.render())
+
+    def _flush_later(self):
+        with self._lock:
+            self._timer = None
+        self.flush(force=True)
+
+    def render(self):
+        self.flush(force=True)
+        fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT | getattr(os, 'O_CLOEXEC', 0), 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            live, exited = [], []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.prom') or name == self.EXITED:
+                    continue
+                try:
+                    pid = int(name.split('-', 1)[0])
+                except ValueError:
+                    continue
+                (live if _alive(pid) else exited).append(os.path.join(self.directory, name))
+
+            exited_path = os.path.join(self.directory, self.EXITED)
+            totals = _read(exited_path)
+            if exited:
+                totals = merge_expositions([totals, *(_read(path) for path in exited)], cumulative_only=True)
+                _write_atomic(exited_path, totals)
+                for path in exited:
+                    os.unlink(path)
+            return merge_expositions([totals, *(_read(path) for path in live)])
+        finally:
+            os.close(fd)
+
+
+def _read(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return ''
+
+
+def _write_atomic(path, text):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+
+class _CountingCursor:
+    """DBAPI cursor proxy counting the rows fetched through it, for Core and ORM alike."""
+
+    __slots__ = ('_cursor', '_stats')
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.rows_fetched += 1
+            yield row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows_fetched += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._stats.rows_fetched += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows_fetched += len(rows)
+        return rows
+
+
+def _counting(iterable, stats, finish):
+    try:
+        for chunk in iterable:
+            stats.bytes_sent += len(chunk)
+            yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+        finish()
+
+
+def _explain(cursor, dialect, statement, parameters):
+    prefix = EXPLAIN_PREFIXES.get(dialect)
+    if prefix is None or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        return '\n'.join(' '.join(str(column) for column in row) for row in explain_cursor.fetchall())
+    finally:
+        explain_cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None or not conn.info.get('query_started'):
+        return
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    stats.sql_statements += 1
+    stats.sql_seconds += elapsed
+    if context is not None and cursor.description is not None:
+        # The result is built from context.cursor right after this event
+        context.cursor = _CountingCursor(cursor, stats)
+
+    if not has_request_context() or elapsed < current_app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000:
+        return
+    with registry._lock:
+        registry.slow_queries += 1
+    try:
+        plan = None if executemany else _explain(cursor, conn.dialect.name, statement, parameters)
+    except Exception as e:
+        plan = f'EXPLAIN failed: {e}'
+    slow_query_logger.warning(
+        'slow query %.1f ms on %s %s\n%s\nparameters: %r\nplan:\n%s',
+        elapsed * 1000, request.method, request.path, statement, parameters, plan,
+    )
+
+
+_listening = False
+
+
+def _listen():
+    global _listening
+    if _listening:
+        return
+    # Listen on the Engine class so every engine (binds, replicas) is covered
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    _listening = True
+
+
+def init_metrics(app):
+    """Record per-route timing, SQL and payload statistics and expose ``/metrics``."""
+    _listen()
+    shared = SharedMetrics(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_SECONDS']) if app.config['METRICS_DIR'] else None
+    if shared is not None:
+        atexit.register(shared.flush, force=True)
+
+    log_path = app.config.get('SLOW_QUERY_LOG')
+    if log_path and not slow_query_logger.handlers:
+        handler = logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(process)d %(message)s'))
+        slow_query_logger.addHandler(handler)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+        _current.set(g.request_stats)
+
+    @app.after_request
+    def record_request_stats(response):
+        stats = g.get('request_stats')
+        if stats is None:
+            return response
+        method, endpoint, status = request.method, request.endpoint or 'unmatched', response.status_code
+
+        def finish():
+            registry.observe(method, endpoint, status, stats)
+            if _current.get() is stats:
+                _current.set(None)
+            if shared is not None:
+                shared.flush()
+
+        if response.content_length is not None or response.direct_passthrough:
+            stats.bytes_sent = response.content_length or 0
+            finish()
+        else:
+            # Streamed body: SQL keeps running while it is sent, so record
+            # once the last chunk has gone out.
+            response.response = _counting(response.response, stats, finish)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        text = shared.render() if shared is not None else registry.render()
+        return Response(text, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,156 @@
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, jsonify, request
+
+# cProfile hooks the interpreter, so only one profile can run per process
+_cprofile_lock = threading.Lock()
+
+
+class StackSampler(threading.Thread):
+    """Sample one thread's Python stack at a fixed interval.
+
+    The samples are aggregated in the collapsed-stack format understood by
+    flamegraph.pl and speedscope: ``root;caller;callee count``.
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':'))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class RequestProfile:
+    def __init__(self, use_cprofile, interval):
+        self.started = time.perf_counter()
+        self.sampler = StackSampler(threading.get_ident(), interval)
+        self.profiler = cProfile.Profile() if use_cprofile else None
+        self.stopped = False
+
+    def start(self):
+        """Start profiling; raises ProfilerBusy while another cProfile session runs."""
+        if self.profiler is not None:
+            if not _cprofile_lock.acquire(blocking=False):
+                raise ProfilerBusy()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Another profiling tool (a debugger, coverage) is active
+                _cprofile_lock.release()
+                raise ProfilerBusy()
+        self.sampler.start()
+
+    def stop(self, directory, label):
+        """Stop profiling and write the profile; only the first call does anything."""
+        if self.stopped:
+            return None
+        self.stopped = True
+        if self.profiler is not None:
+            self.profiler.disable()
+            _cprofile_lock.release()
+        self.sampler.stop()
+        elapsed_ms = (time.perf_counter() - self.started) * 1000
+        name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{label}_{elapsed_ms:.0f}ms"
+        os.makedirs(directory, exist_ok=True)
+        if self.profiler is not None:
+            self.profiler.dump_stats(os.path.join(directory, name + '.prof'))
+        with open(os.path.join(directory, name + '.collapsed'), 'w') as f:
+            f.write(self.sampler.collapsed())
+        return name
+
+
+def _profiled(iterable, finish):
+    try:
+        yield from iterable
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+        finish()
+
+
+def init_profiling(app):
+    """Profile requests that carry the profiling header.
+
+    Only called when ``PROFILING_ENABLED`` is set, so nothing is registered
+    (and nothing is paid) otherwise. With ``PROFILING_TOKEN`` set, the header
+    value must be ``<token>`` or ``<token>:sampling``; ``sampling`` skips
+    cProfile and keeps only the low-overhead stack sampler.
+    """
+    header = app.config['PROFILING_HEADER']
+    token = app.config['PROFILING_TOKEN']
+    directory = app.config['PROFILING_DIR']
+    interval = app.config['PROFILING_SAMPLE_INTERVAL_MS'] / 1000
+
+    @app.before_request
+    def start_profile():
+        value = request.headers.get(header)
+        if not value:
+            return
+        secret, _, mode = value.partition(':') if token else ('', '', value)
+        if token and secret != token:
+            return
+        profile = RequestProfile(use_cprofile=mode != 'sampling', interval=interval)
+        try:
+            profile.start()
+        except ProfilerBusy:
+            return jsonify({
+                'success': False,
+                'message': f'Another request is being profiled with cProfile; retry, or send {header}: <token>:sampling',
+            }), 409
+        g.request_profile = profile
+
+    def _label():
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', f'{request.method}_{request.endpoint or "unmatched"}')
+
+    @app.after_request
+    def stop_profile(response):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return response
+        label = _label()
+
+        if response.is_streamed and not response.direct_passthrough:
+            response.response = _profiled(response.response, lambda: profile.stop(directory, label))
+        else:
+            response.headers['X-Profile-Id'] = profile.stop(directory, label)
+        return response
+
+    @app.teardown_request
+    def stop_failed_profile(exc):
+        # after_request is skipped when the view raised; the profile (and the
+        # cProfile lock) must still be released
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            profile.stop(directory, _label())
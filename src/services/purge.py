@@ -0,0 +1,106 @@
+"""Deleting sessions and everything recorded under them.
+
+Details are removed with bulk ``DELETE`` statements in chunks of
+``chunk_rows``, each committed on its own, so the SQLite writer lock is only
+ever held for one short chunk and scans in other sessions keep flowing
+during a large purge. The foreign keys are declared ``ON DELETE CASCADE`` as
+well, but SQLite only enforces them with ``PRAGMA foreign_keys`` and on
+tables created after the declaration, so the rows are deleted explicitly.
+
+The session rows go last: if a purge is interrupted, the sessions are still
+there and running it again deletes what is left.
+"""
+import os
+import sqlite3
+from contextlib import closing
+
+from sqlalchemy import delete, select
+
+from src.models.stock_opname import db, StockOpnameSession, StockOpnameDetail, SessionArchive, SessionBook
+from src.services.product_import import LOOKUP_CHUNK
+
+
+def sessions_between(start=None, end=None, status=None):
+    """Ids of sessions started in ``[start, end)``, optionally with one status."""
+    query = select(StockOpnameSession.id).order_by(StockOpnameSession.id)
+    if start is not None:
+        query = query.where(StockOpnameSession.waktu_mulai >= start)
+    if end is not None:
+        query = query.where(StockOpnameSession.waktu_mulai < end)
+    if status is not None:
+        query = query.where(StockOpnameSession.status == status)
+    return db.session.execute(query).scalars().all()
+
+
+def _delete_details(session_ids, chunk_rows):
+    deleted = 0
+    while True:
+        chunk = select(StockOpnameDetail.id).where(
+            StockOpnameDetail.session_id.in_(session_ids)
+        ).limit(chunk_rows).scalar_subquery()
+        count = db.session.execute(delete(StockOpnameDetail).where(StockOpnameDetail.id.in_(chunk))).rowcount
+        db.session.commit()
+        deleted += count
+        if count < chunk_rows:
+            return deleted
+
+
+def _delete_book(session_ids, chunk_rows):
+    # session_book is clustered on (session_id, product_id), so each chunk is
+    # a range of product ids: everything up to the chunk_rows-th one
+    for session_id in session_ids:
+        while True:
+            last = db.session.execute(
+                select(SessionBook.product_id).where(SessionBook.session_id == session_id)
+                .order_by(SessionBook.product_id).offset(chunk_rows - 1).limit(1)
+            ).scalar()
+            query = delete(SessionBook).where(SessionBook.session_id == session_id)
+            if last is not None:
+                query = query.where(SessionBook.product_id <= last)
+            db.session.execute(query)
+            db.session.commit()
+            if last is None:
+                break
+
+
+def _delete_archived_details(archive_dir, archives):
+    by_file = {}
+    for session_id, file in archives:
+        by_file.setdefault(file, []).append(session_id)
+    for file, session_ids in by_file.items():
+        path = os.path.join(archive_dir, file)
+        if not os.path.exists(path):
+            continue
+        with closing(sqlite3.connect(path)) as conn, conn:
+            conn.execute(
+                f"DELETE FROM stock_opname_details WHERE session_id IN ({', '.join('?' * len(session_ids))})",
+                session_ids,
+            )
+
+
+def delete_sessions(session_ids, archive_dir, chunk_rows=10_000):
+    """Delete sessions with their details, live or archived, and their book.
+
+    Returns ``(sessions_deleted, details_deleted)``; archived details are
+    counted from their ``session_archives`` rows.
+    """
+    sessions_deleted = details_deleted = 0
+    session_ids = sorted(session_ids)
+    for start in range(0, len(session_ids), LOOKUP_CHUNK):
+        ids = session_ids[start:start + LOOKUP_CHUNK]
+        details_deleted += _delete_details(ids, chunk_rows)
+        _delete_book(ids, chunk_rows)
+
+        archives = db.session.execute(
+            select(SessionArchive.session_id, SessionArchive.file, SessionArchive.row_count)
+            .where(SessionArchive.session_id.in_(ids))
+        ).all()
+        _delete_archived_details(archive_dir, [(session_id, file) for session_id, file, _ in archives])
+        details_deleted += sum(row_count for _, _, row_count in archives)
+
+        db.session.execute(delete(SessionArchive).where(SessionArchive.session_id.in_(ids)))
+        sessions_deleted += db.session.execute(
+            delete(StockOpnameSession).where(StockOpnameSession.id.in_(ids))
+        ).rowcount
+        db.session.commit()
+    return sessions_deleted, details_deleted
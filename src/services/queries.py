@@ -0,0 +1,35 @@
+from sqlalchemy import and_
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+UPSERT_DIALECTS = {'sqlite': sqlite, 'postgresql': postgresql}
+
+
+def prefix_filter(column, prefix):
+    """Match rows whose ``column`` starts with ``prefix``.
+
+    Written as a half-open range instead of ``LIKE 'prefix%'`` so SQLite can
+    answer it from a plain (BINARY collation) index on ``column``.
+    """
+    return and_(column >= prefix, column < prefix + '\U0010ffff')
+
+
+def upsert_insert(connection, table):
+    """An ``INSERT`` on ``table`` that supports ``.on_conflict_do_update()``."""
+    dialect = UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect is None:
+        raise RuntimeError(f'upserts are not supported on {connection.dialect.name}')
+    return dialect.insert(table)
+
+
+def parse_id_list(value):
+    """Parse ``"1,2,3"`` (or a list of such strings) into a sorted tuple of ints."""
+    if isinstance(value, str):
+        value = [value]
+    ids = set()
+    for part in value or []:
+        for item in part.split(','):
+            item = item.strip()
+            if item:
+                ids.add(int(item))
+    return tuple(sorted(ids))
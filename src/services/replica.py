@@ -0,0 +1,137 @@
+"""Read-replica routing.
+
+Views decorated with ``@read_replica`` (reports, exports, detail listings)
+read from the ``replica`` bind when ``REPLICA_DATABASE_URL`` is set; all
+other views, and all writes, use the primary. After a successful write the
+client gets a short-lived cookie that keeps its reads on the primary, so it
+always sees its own changes even while the replica lags behind.
+
+The replica can be a Postgres streaming replica or a second SQLite file. A
+SQLite replica is refreshed from the primary with the online backup API by
+``flask refresh-replica`` or, with ``REPLICA_REFRESH_SECONDS`` set, by a
+background thread in each worker.
+"""
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import g, request
+from sqlalchemy.pool import NullPool
+
+from src.models.routing import REPLICA_BIND
+from src.services.backup import copy_database, file_lock, sqlite_path
+
+STICKY_COOKIE = 'primary_until'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+logger = logging.getLogger('src.replica')
+
+
+def read_replica(view):
+    """Route the view's queries to the replica, unless the client just wrote."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not g.get('sticky_primary'):
+            g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def configure_replica(app):
+    """Add the replica bind; must run before ``db.init_app``."""
+    url = app.config['REPLICA_DATABASE_URL']
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    path = sqlite_path(url)
+    if path is not None:
+        # Opened read-only, and never pooled: after a refresh swaps the file,
+        # new connections must open the new one
+        binds[REPLICA_BIND] = {'url': f'sqlite:///file:{path}?mode=ro&uri=true', 'poolclass': NullPool}
+    else:
+        binds[REPLICA_BIND] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_replica(app):
+    sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+
+    @app.before_request
+    def check_sticky_primary():
+        until = request.cookies.get(STICKY_COOKIE, type=float)
+        g.sticky_primary = until is not None and until > time.time()
+
+    @app.after_request
+    def set_sticky_primary(response):
+        if request.method in WRITE_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + sticky_seconds)),
+                                max_age=sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    if app.config['REPLICA_REFRESH_SECONDS'] > 0 and replica_paths(app) is not None:
+        @app.before_request
+        def ensure_replica_refresher():
+            replica_refresher(app)
+
+
+def replica_paths(app):
+    """``(primary, replica)`` file paths when both databases are SQLite files."""
+    primary = sqlite_path(app.config['SQLALCHEMY_DATABASE_URI'])
+    replica = sqlite_path(app.config['REPLICA_DATABASE_URL'] or 'sqlite://')
+    if primary is None or replica is None:
+        return None
+    return primary, replica
+
+
+def refresh_replica(app):
+    """Copy the primary over a SQLite replica; returns the replica's size in bytes."""
+    paths = replica_paths(app)
+    if paths is None:
+        raise RuntimeError('refresh needs REPLICA_DATABASE_URL and the primary to both be SQLite files')
+    return copy_database(*paths)
+
+
+class ReplicaRefresher(threading.Thread):
+    """Keep a SQLite replica at most ``interval`` seconds behind the primary.
+
+    Every worker may run one. The copy happens under a lock file, and a
+    refresher that finds the replica already fresh (another worker just
+    copied it) skips its round.
+    """
+
+    def __init__(self, app, interval):
+        super().__init__(daemon=True, name='replica-refresher')
+        self.app = app
+        self.interval = interval
+        self.pid = os.getpid()
+
+    def run(self):
+        replica = replica_paths(self.app)[1]
+        while True:
+            try:
+                with file_lock(replica + '.lock'):
+                    if not os.path.exists(replica) or os.path.getmtime(replica) < time.time() - self.interval * 0.9:
+                        refresh_replica(self.app)
+            except Exception:
+                logger.exception('Replica refresh failed')
+            time.sleep(self.interval)
+
+
+_lock = threading.Lock()
+
+
+def replica_refresher(app):
+    """The current worker's refresher, started on its first request.
+
+    Never started in gunicorn's preloading master: a thread there would not
+    survive the fork, and a lock it held would be inherited by every worker.
+    """
+    refresher = app.extensions.get('replica_refresher')
+    if refresher is None or refresher.pid != os.getpid():
+        with _lock:
+            refresher = app.extensions.get('replica_refresher')
+            if refresher is None or refresher.pid != os.getpid():
+                refresher = ReplicaRefresher(app, app.config['REPLICA_REFRESH_SECONDS'])
+                refresher.start()
+                app.extensions['replica_refresher'] = refresher
+    return refresher
@@ -0,0 +1,143 @@
+"""Admission control that keeps bulk requests from crowding out scans.
+
+Routes are interactive (scans, searches, session bookkeeping) unless they
+are decorated with ``@bulk_route`` (imports, exports, reports). In each
+worker process at most ``BULK_MAX_CONCURRENCY`` bulk requests run at once
+and at most ``BULK_MAX_QUEUE`` more wait for a slot. Anything beyond that,
+or anything that waits longer than ``BULK_QUEUE_TIMEOUT``, is answered
+right away with ``503`` and ``Retry-After``.
+
+A gthread worker has a fixed number of threads, and a waiting bulk request
+still occupies one of them. Capping running plus queued bulk requests below
+the thread count therefore always leaves threads free for scans, however
+many exports are requested.
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, make_response
+
+
+class BulkLimiter:
+    def __init__(self, max_concurrency=1, max_queue=1, timeout=30.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self._condition = threading.Condition()
+
+    def configure(self, max_concurrency, max_queue, timeout):
+        with self._condition:
+            self.max_concurrency = max_concurrency
+            self.max_queue = max_queue
+            self.timeout = timeout
+            self._condition.notify_all()
+
+    def acquire(self):
+        """Take a slot, waiting if the queue has room; ``False`` means rejected."""
+        started = time.perf_counter()
+        with self._condition:
+            if self.running >= self.max_concurrency or self.waiting:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+                try:
+                    admitted = self._condition.wait_for(
+                        lambda: self.running < self.max_concurrency, timeout=self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    self.rejected += 1
+                    return False
+            self.running += 1
+            self.admitted += 1
+            self.wait_seconds += time.perf_counter() - started
+            return True
+
+    def release(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+    def collect(self):
+        """Exposition lines for ``/metrics``."""
+        with self._condition:
+            return [
+                '# HELP bulk_requests_running Bulk requests running, summed over workers.',
+                '# TYPE bulk_requests_running gauge',
+                f'bulk_requests_running {self.running}',
+                '# HELP bulk_requests_queued Bulk requests waiting for a slot, summed over workers.',
+                '# TYPE bulk_requests_queued gauge',
+                f'bulk_requests_queued {self.waiting}',
+                '# HELP bulk_requests_limit Bulk request slots, summed over workers.',
+                '# TYPE bulk_requests_limit gauge',
+                f'bulk_requests_limit {self.max_concurrency}',
+                '# HELP bulk_requests_admitted_total Bulk requests given a slot.',
+                '# TYPE bulk_requests_admitted_total counter',
+                f'bulk_requests_admitted_total {self.admitted}',
+                '# HELP bulk_requests_rejected_total Bulk requests answered with 503.',
+                '# TYPE bulk_requests_rejected_total counter',
+                f'bulk_requests_rejected_total {self.rejected}',
+                '# HELP bulk_queue_wait_seconds_total Time admitted bulk requests spent queued.',
+                '# TYPE bulk_queue_wait_seconds_total counter',
+                f'bulk_queue_wait_seconds_total {self.wait_seconds:.6f}',
+            ]
+
+
+bulk_limiter = BulkLimiter()
+
+
+def bulk_route(view):
+    """Run the view under the bulk limiter.
+
+    The slot is held until the response is sent, including the body of a
+    streamed response, since that is where streamed reports do their work.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['BULK_LIMIT_ENABLED']:
+            return view(*args, **kwargs)
+        if not bulk_limiter.acquire():
+            response = jsonify({
+                'success': False,
+                'message': 'Server is busy with other imports/exports, please try again shortly'
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(current_app.config['BULK_RETRY_AFTER'])
+            return response
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            bulk_limiter.release()
+            raise
+        # Werkzeug skips close callbacks for direct passthrough (file) bodies
+        if response.is_streamed and not response.direct_passthrough:
+            response.call_on_close(bulk_limiter.release)
+        else:
+            bulk_limiter.release()
+        return response
+    return wrapper
+
+
+_collector_registered = False
+
+
+def init_scheduling(app):
+    global _collector_registered
+    bulk_limiter.configure(
+        app.config['BULK_MAX_CONCURRENCY'],
+        app.config['BULK_MAX_QUEUE'],
+        app.config['BULK_QUEUE_TIMEOUT'],
+    )
+    if app.config['METRICS_ENABLED'] and not _collector_registered:
+        from src.services.metrics import registry
+
+        registry.register_collector(bulk_limiter.collect)
+        _collector_registered = True
@@ -0,0 +1,78 @@
+"""Book quantities snapshotted when a session starts.
+
+Variance compares counted quantities with ``Product.saldo_awal``, which the
+next product import overwrites, so the variance of a finished session would
+drift with every import. A session created with a book scope copies the
+``saldo_awal`` of the products in scope into ``session_book`` instead, with
+one ``INSERT ... SELECT`` (a few per ``LOOKUP_CHUNK`` ids for an explicit
+product list), so a catalog of 500k products is snapshotted inside SQLite
+without a round trip per row.
+
+Readers use ``BOOK_SALDO_AWAL``: the snapshot where one was taken, and the
+product's current ``saldo_awal`` for sessions or products without one.
+"""
+from sqlalchemy import and_, func, insert, literal, select
+
+from src.models.stock_opname import db, Product, StockOpnameDetail, SessionBook
+from src.services.product_import import LOOKUP_CHUNK
+from src.services.queries import prefix_filter
+
+BOOK_SALDO_AWAL = func.coalesce(SessionBook.saldo_awal, Product.saldo_awal).label('saldo_awal')
+
+
+def join_book(query):
+    """Outer-join the details in ``query`` to their session's book."""
+    return query.outerjoin(SessionBook, and_(
+        SessionBook.session_id == StockOpnameDetail.session_id,
+        SessionBook.product_id == StockOpnameDetail.product_id,
+    ))
+
+
+def parse_book_scope(value):
+    """``(kode_prefix, product_ids)`` from the ``book`` field of a new session.
+
+    ``true`` snapshots every product; an object narrows it with
+    ``kode_prefix`` and/or ``product_ids``. Returns ``None`` for no snapshot
+    and raises ValueError on anything else.
+    """
+    if value is None or value is False:
+        return None
+    if value is True:
+        return None, None
+    if not isinstance(value, dict):
+        raise ValueError('book must be true or an object with kode_prefix and/or product_ids')
+    kode_prefix = value.get('kode_prefix') or None
+    product_ids = value.get('product_ids')
+    if product_ids is not None:
+        if not isinstance(product_ids, list) or not all(isinstance(id, int) for id in product_ids):
+            raise ValueError('book.product_ids must be a list of product ids')
+        product_ids = sorted(set(product_ids))
+    return kode_prefix, product_ids
+
+
+def snapshot_book(session_id, kode_prefix=None, product_ids=None):
+    """Copy the current ``saldo_awal`` of the products in scope into the session's book.
+
+    The caller commits. Returns the number of products snapshotted.
+    """
+    query = select(literal(session_id), Product.id, Product.saldo_awal).order_by(Product.id)
+    if kode_prefix:
+        query = query.where(prefix_filter(Product.kode_produk, kode_prefix))
+    columns = ['session_id', 'product_id', 'saldo_awal']
+
+    if product_ids is None:
+        return db.session.execute(insert(SessionBook).from_select(columns, query)).rowcount
+    snapshotted = 0
+    for start in range(0, len(product_ids), LOOKUP_CHUNK):
+        chunk = product_ids[start:start + LOOKUP_CHUNK]
+        snapshotted += db.session.execute(
+            insert(SessionBook).from_select(columns, query.where(Product.id.in_(chunk)))
+        ).rowcount
+    return snapshotted
+
+
+def session_book(session_id):
+    """``{product_id: saldo_awal}`` snapshotted for a session (empty without one)."""
+    return dict(db.session.execute(
+        select(SessionBook.product_id, SessionBook.saldo_awal).where(SessionBook.session_id == session_id)
+    ).all())
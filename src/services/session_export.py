@@ -0,0 +1,153 @@
+"""XLSX exports of sessions, one at a time or many streamed as one ZIP.
+
+Month-end closing exports every session of a period. The ZIP is written to
+the response as it grows: each session's rows are read here, rendered to
+XLSX in a process pool, and its entry is written as soon as the render
+finishes, so at most a few renders are ever held in memory and the client
+starts receiving data after the first one. Entries are stored uncompressed
+(XLSX files are zip archives already) and the archive switches to zip64
+records when it outgrows 4 GB.
+"""
+import io
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from src.models.stock_opname import db, StockOpnameSession
+from src.services.cache import LRUCache
+from src.services.details import session_detail_rows
+
+# Completed sessions no longer change, so their rendered XLSX is kept per
+# worker. Keyed on the shared data version (see src/services/data_version.py),
+# like the aggregate cache, since both embed product names and saldo_awal.
+xlsx_cache = LRUCache(maxsize=32)
+# Renders waiting in the pool per worker process
+RENDER_BACKLOG = 2
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+
+def session_export_data(session):
+    """``(summary, rows)`` for ``render_session_xlsx`` from a session and its details."""
+    details = session_detail_rows(session.id)
+    rows = [
+        (detail.kode_produk, detail.nama_produk, detail.saldo_awal, detail.jumlah_barang,
+         detail.catatan or '', _timestamp(detail.created_at))
+        for detail in details
+    ]
+    summary = {
+        'Lokasi': session.lokasi,
+        'Waktu Mulai': _timestamp(session.waktu_mulai),
+        'Waktu Selesai': _timestamp(session.waktu_selesai) or 'Belum selesai',
+        'Status': session.status,
+        'Total Item': len(details),
+    }
+    return summary, rows
+
+
+def load_session_export(session_id):
+    return session_export_data(db.session.get(StockOpnameSession, session_id))
+
+
+def xlsx_cache_key(session_id, status, waktu_selesai, version):
+    """Cache key of a session's export, ``None`` while it can still change.
+
+    ``version`` is the ``data_version()`` read before the session's data.
+    """
+    return (version, session_id, waktu_selesai) if status == 'completed' else None
+
+
+def render_session(session_id, status, waktu_selesai, version, load):
+    """XLSX bytes of one session, from the cache when completed; ``load()`` reads its data."""
+    from src.services.spreadsheet import render_session_xlsx
+
+    key = xlsx_cache_key(session_id, status, waktu_selesai, version)
+    data = xlsx_cache.get(key) if key is not None else None
+    if data is None:
+        data = render_session_xlsx(*load())
+        if key is not None:
+            xlsx_cache.set(key, data)
+    return data
+
+
+def export_file_name(session_id, lokasi):
+    return f"stock_opname_{re.sub(r'[^A-Za-z0-9_.-]+', '_', lokasi or '')}_{session_id}.xlsx"
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only stream collecting what ``zipfile`` writes until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _cached(session, version):
+    key = xlsx_cache_key(session['id'], session['status'], session['waktu_selesai'], version)
+    return key, xlsx_cache.get(key) if key is not None else None
+
+
+def _renders(sessions, load, max_workers, version):
+    """Yield ``(session, xlsx)`` in the order the renders finish."""
+    # Starting the pool costs more than rendering a single session
+    if max_workers <= 1 or sum(1 for session in sessions if _cached(session, version)[1] is None) <= 1:
+        for session in sessions:
+            yield session, render_session(
+                session['id'], session['status'], session['waktu_selesai'], version, lambda: load(session)
+            )
+        return
+
+    from src.services.spreadsheet import _pool_context, render_session_xlsx
+
+    pending = {}
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as pool:
+        for session in sessions:
+            key, data = _cached(session, version)
+            if data is not None:
+                yield session, data
+                continue
+            pending[pool.submit(render_session_xlsx, *load(session))] = (session, key)
+            while len(pending) >= max_workers * RENDER_BACKLOG:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _finished(pending.pop(future), future.result())
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield _finished(pending.pop(future), future.result())
+
+
+def _finished(item, data):
+    session, key = item
+    if key is not None:
+        xlsx_cache.set(key, data)
+    return session, data
+
+
+def stream_sessions_zip(sessions, load, version, max_workers=1):
+    """Yield the bytes of a ZIP holding one XLSX export per session.
+
+    ``sessions`` are dicts with ``id``, ``lokasi``, ``status`` and
+    ``waktu_selesai``; ``load(session)`` returns its ``(summary, rows)``.
+    ``version`` is the ``data_version()`` read before any of their data.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for session, data in _renders(sessions, load, max_workers, version):
+            archive.writestr(export_file_name(session['id'], session['lokasi']), data)
+            yield sink.drain()
+    yield sink.drain()
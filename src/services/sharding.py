@@ -0,0 +1,192 @@
+"""Per-warehouse shards for stock opname sessions.
+
+With ``SHARD_DATABASE_URLS`` set (``"JKT=sqlite:////data/jkt.db SBY=..."``)
+the sessions of each listed warehouse, with their details and archive rows,
+live in that warehouse's own SQLite file, so counts in different warehouses
+no longer queue for one write lock. A session's warehouse is the part of
+its ``lokasi`` before ``SHARD_KEY_SEPARATOR`` (``"JKT/Rak A-01"`` -> ``JKT``)
+unless one is given explicitly when the session is created. Sessions of
+other warehouses, and every session created before sharding was turned on,
+stay in the main database, which acts as the default shard.
+
+Products and everything else stay in the main database. Every shard
+connection ``ATTACH``-es it, so the existing queries that join details to
+``products`` run unchanged inside a shard.
+
+Routing: session ids are allocated in the main database's
+``session_shards`` table, which also records each new session's shard.
+Requests whose URL carries a ``session_id`` look it up (cached, the mapping
+never changes) and set ``g.shard``, and ``RoutingSession`` then sends all
+of the request's queries to that shard. Reads that span sessions (session
+lists, company-wide aggregates, purges) run once per shard in parallel with
+``fan_out`` and merge the results.
+
+Backups cover the main database only. Restoring one rolls the directory
+back while the shards keep their newer sessions, so ``resync_session_directory``
+re-registers those afterwards: they stay reachable, and new ids are
+allocated above them instead of reusing ids that still have details.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, request
+from sqlalchemy import event, func, insert, literal, select
+
+from src.models.routing import SHARD_BIND_PREFIX
+from src.models.stock_opname import db, StockOpnameSession, SessionShard
+from src.services.backup import sqlite_path
+from src.services.cache import LRUCache
+
+# session_id -> shard name (None for the main database)
+_session_shards = LRUCache(maxsize=65536)
+_MISSING = object()
+
+
+def parse_shard_urls(value):
+    """``{name: url}`` from ``"NAME=url NAME=url"`` (or a dict, as given in tests)."""
+    if isinstance(value, dict):
+        return {name.upper(): url for name, url in value.items()}
+    shards = {}
+    for item in (value or '').replace(',', ' ').split():
+        name, _, url = item.partition('=')
+        if not url:
+            raise ValueError(f'SHARD_DATABASE_URLS entries must look like NAME=url, got {item!r}')
+        shards[name.strip().upper()] = url.strip()
+    return shards
+
+
+def configure_sharding(app):
+    """Add one bind per shard; must run before ``db.init_app``."""
+    shards = parse_shard_urls(app.config['SHARD_DATABASE_URLS'])
+    if not shards:
+        return
+    if sqlite_path(app.config['SQLALCHEMY_DATABASE_URI']) is None:
+        raise RuntimeError('Sharding needs the main database to be a SQLite file')
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for name, url in shards.items():
+        binds[SHARD_BIND_PREFIX + name] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.config['SHARDS'] = sorted(shards)
+
+
+def init_sharding(app):
+    if not app.config.get('SHARDS'):
+        return
+    catalog = sqlite_path(app.config['SQLALCHEMY_DATABASE_URI'])
+
+    def attach_catalog(dbapi_connection, connection_record):
+        dbapi_connection.execute('ATTACH DATABASE ? AS catalog', (catalog,))
+
+    with app.app_context():
+        for name in app.config['SHARDS']:
+            event.listen(db.engines[SHARD_BIND_PREFIX + name], 'connect', attach_catalog)
+
+    @app.before_request
+    def route_to_shard():
+        session_id = (request.view_args or {}).get('session_id')
+        if session_id is not None:
+            g.shard = session_shard(session_id)
+
+
+def shards():
+    """Every shard, ``None`` being the main database."""
+    return [None, *current_app.config.get('SHARDS', [])]
+
+
+def shard_engine(shard):
+    return db.engines[SHARD_BIND_PREFIX + shard] if shard else db.engine
+
+
+def warehouse_shard(lokasi, warehouse=None):
+    """The shard a new session at ``lokasi`` belongs to, or ``None``."""
+    if not warehouse:
+        warehouse = (lokasi or '').split(current_app.config['SHARD_KEY_SEPARATOR'], 1)[0]
+    warehouse = warehouse.strip().upper()
+    return warehouse if warehouse in current_app.config.get('SHARDS', []) else None
+
+
+def session_shard(session_id):
+    shard = _session_shards.get(session_id, _MISSING)
+    if shard is _MISSING:
+        with db.engine.connect() as connection:
+            row = connection.execute(
+                select(SessionShard.shard).where(SessionShard.session_id == session_id)
+            ).first()
+        if row is None:
+            # Created before sharding, or not created yet: not cached, as
+            # another worker may still allocate this id
+            return None
+        shard = row.shard
+        _session_shards.set(session_id, shard)
+    return shard
+
+
+def assign_session_shard(lokasi, warehouse=None):
+    """Allocate the id of a new session and route the request to its shard.
+
+    Ids are unique across shards: the next one is above every id in the
+    directory and in the main database's own sessions (those created before
+    sharding), computed and inserted in one statement.
+    """
+    shard = warehouse_shard(lokasi, warehouse)
+    directory = SessionShard.__table__
+    next_id = func.max(
+        func.coalesce(select(func.max(directory.c.session_id)).scalar_subquery(), 0),
+        func.coalesce(select(func.max(StockOpnameSession.id)).scalar_subquery(), 0),
+    ) + 1
+    with db.engine.begin() as connection:
+        session_id = connection.execute(
+            insert(directory).from_select(['session_id', 'shard'], select(next_id, literal(shard)))
+            .returning(directory.c.session_id)
+        ).scalar_one()
+    _session_shards.set(session_id, shard)
+    g.shard = shard
+    return session_id
+
+
+def resync_session_directory():
+    """Register every shard's sessions missing from ``session_shards``; returns how many.
+
+    Run after the main database has been restored from a backup.
+    """
+    directory = SessionShard.__table__
+    registered = 0
+    for shard in current_app.config.get('SHARDS', []):
+        with shard_engine(shard).connect() as connection:
+            session_ids = connection.execute(select(StockOpnameSession.id)).scalars().all()
+        if not session_ids:
+            continue
+        with db.engine.begin() as connection:
+            registered += connection.execute(
+                insert(directory).prefix_with('OR IGNORE'),
+                [{'session_id': session_id, 'shard': shard} for session_id in session_ids],
+            ).rowcount
+    _session_shards.clear()
+    return registered
+
+
+def _run_on_shard(app, shard, fn, args):
+    with app.app_context():
+        g.shard = shard
+        return fn(*args)
+
+
+def run_on_shard(shard, fn, *args):
+    """Run ``fn(*args)`` routed to ``shard``, in its own app context when sharded."""
+    if not current_app.config.get('SHARDS'):
+        return fn(*args)
+    return _run_on_shard(current_app._get_current_object(), shard, fn, args)
+
+
+def fan_out(fn, *args):
+    """Run ``fn(*args)`` once per shard, in parallel, each routed to its shard.
+
+    Returns ``[(shard, result), ...]`` in ``shards()`` order. Each call runs in
+    its own app context and therefore its own database session.
+    """
+    app = current_app._get_current_object()
+    names = shards()
+    if len(names) == 1:
+        return [(None, fn(*args))]
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix='shard') as pool:
+        futures = [pool.submit(_run_on_shard, app, name, fn, args) for name in names]
+        return [(name, future.result()) for name, future in zip(names, futures)]
@@ -0,0 +1,385 @@
+"""Parsing of product spreadsheets and CSV files.
+
+This module only depends on pandas so that it can be imported cheaply by the
+worker processes that parse sheets in parallel.
+"""
+import codecs
+import csv
+import io
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Template header -> products column
+PRODUCT_COLUMNS = {'Kode': 'kode_produk', 'Nama Barang': 'nama_produk', 'Jumlah': 'saldo_awal'}
+# Optional template column: the product's barcodes, separated by commas,
+# semicolons or spaces; read as text so leading zeros of EAN/UPC codes survive
+BARCODE_HEADER = 'Barcode'
+BARCODE_SEPARATORS = r'[\s,;|]+'
+
+# CSV headers are matched case-insensitively, against the template headers or
+# the column names of the products export
+CSV_HEADER_ALIASES = {
+    **{header.lower(): header for header in PRODUCT_COLUMNS},
+    **{column: header for header, column in PRODUCT_COLUMNS.items()},
+    'barcode': BARCODE_HEADER,
+    'barcodes': BARCODE_HEADER,
+}
+CSV_DELIMITERS = ',;\t|'
+# Quantities are stored as SQLite INTEGERs (signed 64-bit)
+INTEGER_LIMIT = 2.0 ** 63
+
+# Headers of count files ("kode, qty" exports of handheld scanners), matched
+# case-insensitively; files without a header row are read as code, quantity
+COUNT_HEADER_ALIASES = {
+    'kode': 'kode_produk', 'kode_produk': 'kode_produk', 'code': 'kode_produk', 'sku': 'kode_produk',
+    'qty': 'jumlah_barang', 'jumlah': 'jumlah_barang', 'jumlah_barang': 'jumlah_barang',
+    'quantity': 'jumlah_barang', 'count': 'jumlah_barang',
+}
+CSV_SNIFF_BYTES = 64 * 1024
+
+# Columns of the "Stock Opname" sheet of a session export
+SESSION_EXPORT_COLUMNS = ['Kode Produk', 'Nama Produk', 'Saldo Awal', 'Jumlah Barang', 'Catatan', 'Waktu Input']
+
+
+def _to_integers(raw):
+    """``(numbers, not_number)`` for a column of quantities.
+
+    ``not_number`` flags present values that are not finite numbers within
+    the INTEGER range (text, ``inf``, ``1e30``), which ``astype('int64')``
+    would otherwise raise on or wrap around.
+    """
+    numbers = pd.to_numeric(raw, errors='coerce')
+    values = numbers.to_numpy(dtype='float64', na_value=float('nan'))
+    # False for NaN and for both infinities
+    in_range = abs(values) < INTEGER_LIMIT
+    return numbers, raw.notna().to_numpy() & ~in_range
+
+
+def normalize_products(frame, label='', first_row=2):
+    """Validate raw template rows in bulk.
+
+    Returns ``(products, errors)`` where ``products`` has the columns
+    ``kode_produk``, ``nama_produk``, ``saldo_awal`` and ``row``, plus
+    ``barcodes`` (lists of strings) when the sheet has a Barcode column.
+    ``first_row`` is the spreadsheet row number of the first data row (after
+    the header).
+    """
+    missing = [column for column in PRODUCT_COLUMNS if column not in frame.columns]
+    if missing:
+        return pd.DataFrame(columns=[*PRODUCT_COLUMNS.values(), 'row']), [
+            f"{label}Missing columns: {', '.join(missing)}"
+        ]
+
+    rows = pd.RangeIndex(first_row, first_row + len(frame))
+    kode = frame['Kode'].astype('string').str.strip()
+    nama = frame['Nama Barang'].astype('string').str.strip()
+    raw_jumlah = frame['Jumlah']
+    jumlah, not_number = _to_integers(raw_jumlah)
+
+    empty = kode.isna() | (kode == '') | nama.isna() | (nama == '') | raw_jumlah.isna()
+    not_number = ~empty & not_number
+    valid = (~empty & ~not_number).to_numpy()
+
+    errors = [
+        f'{label}Row {row}: Missing or empty required fields (kode_produk, nama_produk, saldo_awal)'
+        for row in rows[empty.to_numpy()]
+    ]
+    errors += [
+        f'{label}Row {row}: Jumlah is not a number: {value!r}'
+        for row, value in zip(rows[not_number.to_numpy()], raw_jumlah[not_number])
+    ]
+
+    products = pd.DataFrame({
+        'kode_produk': kode[valid].astype(object).to_numpy(),
+        'nama_produk': nama[valid].astype(object).to_numpy(),
+        # Same truncation as int() on the old per-row path
+        'saldo_awal': jumlah[valid].astype('int64').to_numpy(),
+        'row': rows[valid],
+    })
+    if BARCODE_HEADER in frame.columns:
+        barcodes = frame[BARCODE_HEADER].astype('string').str.strip()[valid].fillna('')
+        products['barcodes'] = [
+            [barcode for barcode in re.split(BARCODE_SEPARATORS, value) if barcode]
+            for value in barcodes.tolist()
+        ]
+    return products, errors
+
+
+def parse_product_sheet(path, sheet_name, label=''):
+    """Read and validate one sheet; runs inside a pool worker."""
+    started = time.perf_counter()
+    frame = pd.read_excel(path, sheet_name=sheet_name, dtype={'Kode': str, 'Nama Barang': str, BARCODE_HEADER: str})
+    products, errors = normalize_products(frame, label)
+    return {
+        'sheet': sheet_name,
+        'rows': len(frame),
+        'valid': len(products),
+        'products': products,
+        'errors': errors,
+        'seconds': round(time.perf_counter() - started, 4),
+    }
+
+
+def _pool_context():
+    # A fork server forks workers from a clean process that already imported
+    # pandas, instead of forking the threaded web worker or re-importing
+    # pandas in every spawned child.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['pandas', 'openpyxl', __name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def parse_product_workbooks(files, max_workers=None, min_parallel_bytes=1 << 20):
+    """Parse every sheet of every workbook, in parallel when there are several.
+
+    ``files`` is a list of ``(path, display_name)``. Uploads smaller than
+    ``min_parallel_bytes`` in total are parsed inline, since starting worker
+    processes costs more than parsing them. Returns one result per sheet, in
+    file order then sheet order, each tagged with its ``file``.
+    """
+    tasks = []
+    for path, display_name in files:
+        with pd.ExcelFile(path) as workbook:
+            sheet_names = workbook.sheet_names
+        for sheet_name in sheet_names:
+            label = f'{display_name} [{sheet_name}] ' if len(files) > 1 or len(sheet_names) > 1 else ''
+            tasks.append((display_name, path, sheet_name, label))
+
+    max_workers = min(len(tasks), max_workers or os.cpu_count() or 1)
+    if max_workers <= 1 or sum(os.path.getsize(path) for path, _ in files) < min_parallel_bytes:
+        results = [parse_product_sheet(path, sheet_name, label) for _, path, sheet_name, label in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as pool:
+            futures = [pool.submit(parse_product_sheet, path, sheet_name, label)
+                       for _, path, sheet_name, label in tasks]
+            results = [future.result() for future in futures]
+
+    for (display_name, _, _, _), result in zip(tasks, results):
+        result['file'] = display_name
+    return results
+
+
+def render_session_xlsx(summary, rows):
+    """The XLSX export of one session, as bytes; may run inside a pool worker.
+
+    ``summary`` maps the labels of the Summary sheet to their values and
+    ``rows`` holds one tuple per detail, in ``SESSION_EXPORT_COLUMNS`` order.
+    """
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        pd.DataFrame(rows, columns=SESSION_EXPORT_COLUMNS).to_excel(writer, sheet_name='Stock Opname', index=False)
+        pd.DataFrame({'Informasi': list(summary), 'Detail': list(summary.values())}).to_excel(
+            writer, sheet_name='Summary', index=False
+        )
+    return output.getvalue()
+
+
+def drop_duplicate_products(products):
+    """One row per ``kode_produk``: the last occurrence, with every occurrence's barcodes.
+
+    A sheet without a Barcode column has no barcode data (``NaN`` after a
+    concat), not an empty barcode list, so it must not discard the barcodes
+    another sheet lists for the same code.
+    """
+    merged = products.drop_duplicates('kode_produk', keep='last')
+    if 'barcodes' in products.columns and len(merged) < len(products):
+        combined = {}
+        for kode_produk, barcodes in zip(products['kode_produk'].tolist(), products['barcodes'].tolist()):
+            if isinstance(barcodes, list):
+                combined.setdefault(kode_produk, {}).update(dict.fromkeys(barcodes))
+        merged = merged.assign(barcodes=[list(combined.get(kode_produk, ())) for kode_produk in merged['kode_produk'].tolist()])
+    return merged
+
+
+def merge_products(frames):
+    """Concatenate parsed products; for a repeated ``kode_produk`` the last occurrence wins.
+
+    "Last" follows the upload order: later files, later sheets, then later
+    rows. The barcodes of all occurrences are kept. Returns
+    ``(products, duplicate_count)``.
+    """
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=[*PRODUCT_COLUMNS.values(), 'row']), 0
+    products = pd.concat(frames, ignore_index=True)
+    merged = drop_duplicate_products(products)
+    return merged, len(products) - len(merged)
+
+
+def detect_encoding(sample):
+    """Guess the encoding of a CSV from its first bytes.
+
+    A byte order mark wins; otherwise the sample must decode as UTF-8, and
+    anything else is taken to be Windows-1252, which is what Excel writes when
+    it saves "CSV" on an Indonesian or English Windows install.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # final=False: the sample may end in the middle of a character
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+def detect_delimiter(sample, encoding, filename=''):
+    """Sniff the delimiter from the first lines; falls back on the file extension."""
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample, final=False)
+    lines = text.splitlines()
+    if len(sample) == CSV_SNIFF_BYTES and len(lines) > 1:
+        # The sample probably ends in the middle of a line
+        lines.pop()
+    lines = lines[:20]
+    try:
+        return csv.Sniffer().sniff('\n'.join(lines), delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return '\t' if filename.lower().endswith('.tsv') else ','
+
+
+class _Prepended(io.RawIOBase):
+    """A read-only stream that replays ``head`` before reading from ``stream``."""
+
+    def __init__(self, head, stream):
+        self._head = memoryview(head)
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class CsvProductReader:
+    """Read a product CSV/TSV from a binary stream in chunks.
+
+    The stream is consumed once, front to back, so it can be the raw request
+    body. Encoding and delimiter are detected from the first
+    ``CSV_SNIFF_BYTES`` unless given. Iterating yields
+    ``(products, errors, rows)`` for every chunk of ``chunk_rows`` lines, with
+    the same validation and error messages as the Excel import; row numbers
+    count the header as row 1.
+    """
+
+    def __init__(self, stream, filename='', encoding=None, delimiter=None, chunk_rows=100_000):
+        sample = stream.read(CSV_SNIFF_BYTES)
+        self.encoding = encoding or detect_encoding(sample)
+        self.delimiter = delimiter or detect_delimiter(sample, self.encoding, filename)
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._stream = io.BufferedReader(_Prepended(sample, stream), buffer_size=1 << 20)
+        self._empty = not sample
+
+    def __iter__(self):
+        if self._empty:
+            return
+        chunks = pd.read_csv(
+            self._stream,
+            sep=self.delimiter,
+            encoding=self.encoding,
+            dtype=str,
+            # Only truly empty fields are missing; "NA" is a valid name or code
+            keep_default_na=False,
+            na_values=[''],
+            skipinitialspace=True,
+            chunksize=self.chunk_rows,
+        )
+        with chunks:
+            for chunk in chunks:
+                chunk = chunk.rename(columns=lambda header: CSV_HEADER_ALIASES.get(
+                    str(header).strip().lower(), header))
+                products, errors = normalize_products(chunk, first_row=self.rows + 2)
+                self.rows += len(chunk)
+                yield products, errors, len(chunk)
+                if not set(PRODUCT_COLUMNS).issubset(chunk.columns):
+                    # Every chunk has the same header, one error is enough
+                    return
+
+
+def read_count_file(stream, filename='', encoding=None, delimiter=None):
+    """Read a count file (CSV/TSV or the first sheet of an XLSX) into ``normalize_counts`` input.
+
+    Returns the raw frame (every cell a string) and the file row number of
+    its first data row.
+    """
+    if filename.lower().endswith(('.xlsx', '.xls')):
+        # Workbooks are zip files and need a seekable stream
+        if not stream.seekable():
+            stream = io.BytesIO(stream.read())
+        frame = pd.read_excel(stream, header=None, dtype=str)
+    else:
+        sample = stream.read(CSV_SNIFF_BYTES)
+        if not sample:
+            return pd.DataFrame(), 1
+        encoding = encoding or detect_encoding(sample)
+        frame = pd.read_csv(
+            io.BufferedReader(_Prepended(sample, stream), buffer_size=1 << 20),
+            sep=delimiter or detect_delimiter(sample, encoding, filename),
+            encoding=encoding,
+            header=None,
+            dtype=str,
+            keep_default_na=False,
+            na_values=[''],
+            skipinitialspace=True,
+        )
+
+    if len(frame) and COUNT_HEADER_ALIASES.get(str(frame.iat[0, 0]).strip().lower()) == 'kode_produk':
+        header = [COUNT_HEADER_ALIASES.get(str(value).strip().lower(), value) for value in frame.iloc[0]]
+        frame = frame.iloc[1:].set_axis(header, axis=1).reset_index(drop=True)
+        return frame, 2
+    return frame.rename(columns={0: 'kode_produk', 1: 'jumlah_barang'}), 1
+
+
+def normalize_counts(frame, first_row=1):
+    """Validate count rows in bulk.
+
+    Returns ``(counts, errors)`` where ``counts`` has the columns
+    ``kode_produk``, ``jumlah_barang`` and ``row``.
+    """
+    missing = [column for column in ('kode_produk', 'jumlah_barang') if column not in frame.columns]
+    if missing:
+        return pd.DataFrame(columns=['kode_produk', 'jumlah_barang', 'row']), [
+            f"Missing columns: {', '.join(missing)}"
+        ]
+
+    rows = pd.RangeIndex(first_row, first_row + len(frame))
+    kode = frame['kode_produk'].astype('string').str.strip()
+    raw_qty = frame['jumlah_barang']
+    qty, not_number = _to_integers(raw_qty)
+
+    empty = kode.isna() | (kode == '') | raw_qty.isna()
+    not_number = ~empty & not_number
+    valid = (~empty & ~not_number).to_numpy()
+
+    errors = [
+        f'Row {row}: Missing kode or qty'
+        for row in rows[empty.to_numpy()]
+    ]
+    errors += [
+        f'Row {row}: Qty is not a number: {value!r}'
+        for row, value in zip(rows[not_number.to_numpy()], raw_qty[not_number])
+    ]
+
+    counts = pd.DataFrame({
+        'kode_produk': kode[valid].astype(object).to_numpy(),
+        'jumlah_barang': qty[valid].astype('int64').to_numpy(),
+        'row': rows[valid],
+    })
+    return counts, errors
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+
+from flask import request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings we may have precompressed siblings for, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+
+# Bundler output such as ``assets/index-4f2a9c1b.js`` carries its content
+# hash in the name, so it can be cached forever. Only hex hashes are
+# recognised by name; a plain word such as ``logo-dashboard.svg`` is not
+# one. Files listed in a Vite build manifest count as fingerprinted whatever
+# their hash alphabet.
+FINGERPRINTED = re.compile(r'[-.][0-9a-f]{8,}\.[A-Za-z0-9]+$')
+BUILD_MANIFESTS = ('.vite/manifest.json', 'manifest.json')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class Asset:
+    __slots__ = ('path', 'mimetype', 'etag', 'mtime', 'immutable', 'variants')
+
+    def __init__(self, path, mimetype, etag, mtime, immutable):
+        self.path = path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.mtime = mtime
+        self.immutable = immutable
+        self.variants = {}
+
+
+def _manifest_files(folder):
+    """Output files named in a Vite build manifest, relative to ``folder``."""
+    for name in BUILD_MANIFESTS:
+        path = os.path.join(folder, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(manifest, dict):
+            continue
+        files = set()
+        for chunk in manifest.values():
+            if isinstance(chunk, dict):
+                files.add(chunk.get('file'))
+                files.update(chunk.get('css') or [])
+                files.update(chunk.get('assets') or [])
+        files.discard(None)
+        return files
+    return set()
+
+
+def _digest(path):
+    h = hashlib.blake2b(digest_size=10)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class StaticAssets:
+    """In-memory manifest of the SPA's static files.
+
+    The folder is scanned once: every file gets a content-hash ETag, its
+    modification time, and any ``.br``/``.gz`` sibling produced by
+    ``flask precompress-static``. Requests are then answered from the
+    manifest without touching the filesystem to check for existence.
+    With ``rescan=True`` (debug mode) the folder is rescanned on every miss.
+    """
+
+    def __init__(self, folder, rescan=False):
+        self.folder = folder
+        self.rescan = rescan
+        self._lock = threading.Lock()
+        self._assets = self._scan()
+
+    def _scan(self):
+        assets = {}
+        if not self.folder or not os.path.isdir(self.folder):
+            return assets
+        hashed = _manifest_files(self.folder)
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith(('.gz', '.br')):
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                asset = Asset(
+                    path=path,
+                    mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                    etag=_digest(path),
+                    mtime=os.path.getmtime(path),
+                    immutable=relative in hashed or bool(FINGERPRINTED.search(name)),
+                )
+                for encoding, suffix in ENCODINGS:
+                    if name + suffix in files:
+                        asset.variants[encoding] = (path + suffix, suffix)
+                assets[relative] = asset
+        return assets
+
+    def find(self, path):
+        asset = self._assets.get(path)
+        if asset is None and self.rescan:
+            with self._lock:
+                self._assets = self._scan()
+            asset = self._assets.get(path)
+        return asset
+
+    def send(self, asset):
+        path, etag, encoding = asset.path, asset.etag, None
+        for candidate, (variant_path, suffix) in asset.variants.items():
+            if request.accept_encodings[candidate]:
+                path, etag, encoding = variant_path, f'{asset.etag}{suffix}', candidate
+                break
+
+        response = send_file(
+            path,
+            mimetype=asset.mimetype,
+            download_name=os.path.basename(asset.path),
+            etag=etag,
+            last_modified=asset.mtime,
+            max_age=IMMUTABLE_MAX_AGE if asset.immutable else None,
+            conditional=True,
+        )
+        if asset.immutable:
+            response.cache_control.immutable = True
+        else:
+            # Always revalidate, which is a cheap 304 while the ETag matches
+            response.cache_control.public = True
+            response.cache_control.no_cache = True
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        return response
+
+
+def precompress(folder, min_size=1024):
+    """Write ``.gz`` (and ``.br`` when brotli is installed) next to compressible files.
+
+    Returns the number of variants written.
+    """
+    written = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith(('.gz', '.br')):
+                continue
+            mimetype = mimetypes.guess_type(name)[0] or ''
+            path = os.path.join(root, name)
+            if not mimetype.startswith(COMPRESSIBLE_TYPES) or os.path.getsize(path) < min_size:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', brotli.compress(data, quality=11)))
+            for suffix, compressed in variants:
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                os.utime(path + suffix, (os.path.getatime(path), os.path.getmtime(path)))
+                written += 1
+    return written
@@ -0,0 +1,197 @@
+"""Resumable uploads written straight to disk.
+
+The protocol follows the shape of tus: create an upload, append the bytes
+with ``PUT`` at an offset (resuming from the offset the server reports after
+a dropped connection), then finalize with the file's SHA-256. The request
+body is copied to the ``.part`` file block by block, so neither Werkzeug nor
+the handler ever holds the file in memory, and the finalized file is handed
+to the importers by path.
+"""
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, development server only
+    fcntl = None
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+ALLOWED_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.tsv', '.txt')
+COPY_BLOCK_BYTES = 1 << 20
+
+
+class UploadError(Exception):
+    """A request the upload cannot accept; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class UploadStore:
+    def __init__(self, directory, ttl, max_bytes):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def _path(self, upload_id, suffix):
+        return os.path.join(self.directory, upload_id + suffix)
+
+    def _write_meta(self, upload):
+        temporary = self._path(upload['id'], '.json.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(upload, f)
+        os.replace(temporary, self._path(upload['id'], '.json'))
+
+    def create(self, filename, size, sha256=None):
+        extension = os.path.splitext(filename or '')[1].lower()
+        if extension not in ALLOWED_EXTENSIONS:
+            raise UploadError(f"File must be one of: {', '.join(ALLOWED_EXTENSIONS)}")
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('size must be a positive number of bytes')
+        if size > self.max_bytes:
+            raise UploadError(f'File is larger than the {self.max_bytes} byte limit', 413)
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        upload = {
+            'id': secrets.token_hex(16),
+            'filename': filename,
+            'extension': extension,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'status': 'uploading',
+            'created_at': time.time(),
+        }
+        open(self._path(upload['id'], '.part'), 'wb').close()
+        self._write_meta(upload)
+        return self.status(upload)
+
+    def get(self, upload_id):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            return None
+        try:
+            with open(self._path(upload_id, '.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _require(self, upload_id):
+        upload = self.get(upload_id)
+        if upload is None:
+            raise UploadError('Upload not found or expired', 404)
+        return upload
+
+    def received(self, upload):
+        if upload['status'] == 'complete':
+            return upload['size']
+        try:
+            return os.path.getsize(self._path(upload['id'], '.part'))
+        except FileNotFoundError:
+            return 0
+
+    def status(self, upload):
+        return {
+            'id': upload['id'],
+            'filename': upload['filename'],
+            'size': upload['size'],
+            'offset': self.received(upload),
+            'status': upload['status'],
+        }
+
+    @contextmanager
+    def _locked(self, f):
+        # One writer per upload: a client retrying while the old request is
+        # still draining must not interleave bytes with it
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('Another request is writing to this upload', 409)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def write(self, upload_id, offset, stream):
+        """Write ``stream`` at ``offset`` and return the new status.
+
+        ``offset`` may rewind to resend bytes that were only partly received,
+        but may not skip ahead of what is already on disk.
+        """
+        upload = self._require(upload_id)
+        if upload['status'] != 'uploading':
+            raise UploadError('Upload is already finalized', 409, offset=upload['size'])
+
+        with open(self._path(upload_id, '.part'), 'r+b') as f, self._locked(f):
+            received = os.fstat(f.fileno()).st_size
+            if offset is None or offset < 0 or offset > received:
+                raise UploadError(f'Offset must be between 0 and {received}', 409, offset=received)
+            f.seek(offset)
+            f.truncate()
+            position = offset
+            while True:
+                block = stream.read(COPY_BLOCK_BYTES)
+                if not block:
+                    break
+                position += len(block)
+                if position > upload['size']:
+                    raise UploadError('Chunk goes past the declared size', 413, offset=position - len(block))
+                f.write(block)
+        return self.status(upload)
+
+    def finalize(self, upload_id, sha256=None):
+        """Check size and SHA-256, then mark the upload complete."""
+        upload = self._require(upload_id)
+        if upload['status'] == 'complete':
+            return self.status(upload)
+
+        expected = (sha256 or upload['sha256'] or '').lower()
+        if not expected:
+            raise UploadError('sha256 is required to finalize an upload')
+        part = self._path(upload_id, '.part')
+        with open(part, 'rb') as f, self._locked(f):
+            received = os.fstat(f.fileno()).st_size
+            if received != upload['size']:
+                raise UploadError(f"Upload is incomplete: {received} of {upload['size']} bytes", 409,
+                                  offset=received)
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+            if digest != expected:
+                raise UploadError('Checksum mismatch, upload the file again', 422, sha256=digest)
+            os.replace(part, self._path(upload_id, upload['extension']))
+
+        upload.update(status='complete', sha256=digest, finalized_at=time.time())
+        self._write_meta(upload)
+        return self.status(upload)
+
+    def path(self, upload_id):
+        """Path of a finalized upload, for the importers."""
+        upload = self._require(upload_id)
+        if upload['status'] != 'complete':
+            raise UploadError('Upload is not finalized', 409, offset=self.received(upload))
+        return self._path(upload_id, upload['extension']), upload['filename']
+
+    def discard(self, upload_id):
+        upload = self.get(upload_id)
+        if upload is None:
+            return
+        for suffix in ('.part', upload['extension'], '.json'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                upload = self.get(entry.name[:-len('.json')])
+                if upload is not None and upload['created_at'] < cutoff:
+                    self.discard(upload['id'])